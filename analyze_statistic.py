@@ -2819,11 +2819,11 @@ def parse_metrics(file_path, metric_name):
     """
     metric_dict = {}
     metric_dict["iterations"] = []
+    # iteration xxx {metric_name}: {xxx}
+    reg_exp1 = re.compile(f"iteration (\d+) {metric_name}: (\{{.*\}})")
+    reg_exp2 = re.compile(f"iteration\[(\d+),\d+\) {metric_name}: (\{{.*\}})")
     with open(file_path, "r") as f:
         for line in f:
-            # iteration xxx {metric_name}: {xxx}
-            reg_exp1 = re.compile(f"iteration (\d+) {metric_name}: (\{{.*\}})")
-            reg_exp2 = re.compile(f"iteration\[(\d+),\d+\) {metric_name}: (\{{.*\}})")
             iter_match = reg_exp1.match(line) or reg_exp2.match(line)
             if iter_match:
                 iteration = int(iter_match.group(1))
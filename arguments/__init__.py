@@ -126,6 +126,8 @@ class OptimizationParams(ParamGroup):
         self.densify_grad_threshold = 0.0002
         self.densify_memory_limit_percentage = 0.9
         self.disable_auto_densification = False
+        self.expandable_segments = False  # run the training loop with expandable_segments in the cuda caching allocator, to reduce fragmentation from densification. needs pytorch >= 2.1.
+        self.empty_cache_after_test = False  # release the cuda caching allocator's free blocks after each evaluation in training_report.
         self.opacity_reset_until_iter = -1
         self.random_background = False
         self.min_opacity = 0.005
@@ -182,6 +184,7 @@ class BenchmarkParams(ParamGroup):
         self.check_gpu_memory = False  # check gpu memory usage.
         self.check_cpu_memory = False  # check cpu memory usage.
         self.log_memory_summary = False
+        self.record_memory_history = False  # record the cuda allocator history and dump a snapshot at every densification.
 
         super().__init__(parser, "Benchmark Parameters")
 
@@ -6,6 +6,13 @@ def densification(iteration, scene, gaussians, batched_screenspace_pkg):
     args = utils.get_args()
     timers = utils.get_timers()
     log_file = utils.get_log_file()
+    # the trigger iterations are fixed for the run and cached in get_update_iters().
+    densify_iters = utils.get_update_iters(
+        iteration % args.bsz, args.iterations, args.bsz, args.densification_interval, 0
+    )
+    opacity_reset_iters = utils.get_update_iters(
+        iteration % args.bsz, args.iterations, args.bsz, args.opacity_reset_interval, 0
+    )
 
     # Densification
     if not args.disable_auto_densification and iteration <= args.densify_until_iter:
@@ -13,20 +20,16 @@ def densification(iteration, scene, gaussians, batched_screenspace_pkg):
         timers.start("densification")
 
         timers.start("densification_update_stats")
-        for radii, visibility_filter, screenspace_mean2D in zip(
-            batched_screenspace_pkg["batched_locally_preprocessed_radii"],
-            batched_screenspace_pkg["batched_locally_preprocessed_visibility_filter"],
+        gaussians.update_max_radii2D_batched(
+            batched_screenspace_pkg["batched_locally_preprocessed_radii"]
+        )
+        gaussians.add_densification_stats_batched(
             batched_screenspace_pkg["batched_locally_preprocessed_mean2D"],
-        ):
-            gaussians.max_radii2D[visibility_filter] = torch.max(
-                gaussians.max_radii2D[visibility_filter], radii[visibility_filter]
-            )
-            gaussians.add_densification_stats(screenspace_mean2D, visibility_filter)
+            batched_screenspace_pkg["batched_locally_preprocessed_visibility_filter"],
+        )
         timers.stop("densification_update_stats")
 
-        if iteration > args.densify_from_iter and utils.check_update_at_this_iter(
-            iteration, args.bsz, args.densification_interval, 0
-        ):
+        if iteration > args.densify_from_iter and iteration in densify_iters:
             assert (
                 args.stop_update_param == False
             ), "stop_update_param must be false for densification; because it is a flag for debugging."
@@ -59,6 +62,8 @@ def densification(iteration, scene, gaussians, batched_screenspace_pkg):
                     )
                 )
 
+            # the gaussian tensors changed size: return the freed blocks once, after both steps.
+            torch.cuda.empty_cache()
             utils.check_memory_usage(
                 log_file, args, iteration, gaussians, before_densification_stop=True
             )
@@ -66,9 +71,7 @@ def densification(iteration, scene, gaussians, batched_screenspace_pkg):
             utils.inc_densify_iter()
 
         if (
-            utils.check_update_at_this_iter(
-                iteration, args.bsz, args.opacity_reset_interval, 0
-            )
+            iteration in opacity_reset_iters
             and iteration + args.bsz <= args.opacity_reset_until_iter
         ):
             timers.start("reset_opacity")
@@ -77,9 +80,7 @@ def densification(iteration, scene, gaussians, batched_screenspace_pkg):
 
         timers.stop("densification")
     else:
-        if iteration > args.densify_from_iter and utils.check_update_at_this_iter(
-            iteration, args.bsz, args.densification_interval, 0
-        ):
+        if iteration > args.densify_from_iter and iteration in densify_iters:
             utils.check_memory_usage(
                 log_file, args, iteration, gaussians, before_densification_stop=False
             )
@@ -89,6 +90,13 @@ def gsplat_densification(iteration, scene, gaussians, batched_screenspace_pkg):
     args = utils.get_args()
     timers = utils.get_timers()
     log_file = utils.get_log_file()
+    # the trigger iterations are fixed for the run and cached in get_update_iters().
+    densify_iters = utils.get_update_iters(
+        iteration % args.bsz, args.iterations, args.bsz, args.densification_interval, 0
+    )
+    opacity_reset_iters = utils.get_update_iters(
+        iteration % args.bsz, args.iterations, args.bsz, args.opacity_reset_interval, 0
+    )
 
     # Densification
     if not args.disable_auto_densification and iteration <= args.densify_until_iter:
@@ -101,28 +109,18 @@ def gsplat_densification(iteration, scene, gaussians, batched_screenspace_pkg):
         batched_screenspace_mean2D_grad = batched_screenspace_pkg[
             "batched_locally_preprocessed_mean2D"
         ].grad
-        for i, (radii, visibility_filter) in enumerate(
-            zip(
-                batched_screenspace_pkg["batched_locally_preprocessed_radii"],
-                batched_screenspace_pkg[
-                    "batched_locally_preprocessed_visibility_filter"
-                ],
-            )
-        ):
-            gaussians.max_radii2D[visibility_filter] = torch.max(
-                gaussians.max_radii2D[visibility_filter], radii[visibility_filter]
-            )
-            gaussians.gsplat_add_densification_stats(
-                batched_screenspace_mean2D_grad[i],
-                visibility_filter,
-                image_width,
-                image_height,
-            )
+        gaussians.update_max_radii2D_batched(
+            batched_screenspace_pkg["batched_locally_preprocessed_radii"]
+        )
+        gaussians.gsplat_add_densification_stats_batched(
+            batched_screenspace_mean2D_grad,
+            batched_screenspace_pkg["batched_locally_preprocessed_visibility_filter"],
+            image_width,
+            image_height,
+        )
         timers.stop("densification_update_stats")
 
-        if iteration > args.densify_from_iter and utils.check_update_at_this_iter(
-            iteration, args.bsz, args.densification_interval, 0
-        ):
+        if iteration > args.densify_from_iter and iteration in densify_iters:
             assert (
                 args.stop_update_param == False
             ), "stop_update_param must be false for densification; because it is a flag for debugging."
@@ -155,6 +153,8 @@ def gsplat_densification(iteration, scene, gaussians, batched_screenspace_pkg):
                     )
                 )
 
+            # the gaussian tensors changed size: return the freed blocks once, after both steps.
+            torch.cuda.empty_cache()
             utils.check_memory_usage(
                 log_file, args, iteration, gaussians, before_densification_stop=True
             )
@@ -162,9 +162,7 @@ def gsplat_densification(iteration, scene, gaussians, batched_screenspace_pkg):
             utils.inc_densify_iter()
 
         if (
-            utils.check_update_at_this_iter(
-                iteration, args.bsz, args.opacity_reset_interval, 0
-            )
+            iteration in opacity_reset_iters
             and iteration + args.bsz <= args.opacity_reset_until_iter
         ):
             timers.start("reset_opacity")
@@ -173,9 +171,7 @@ def gsplat_densification(iteration, scene, gaussians, batched_screenspace_pkg):
 
         timers.stop("densification")
     else:
-        if iteration > args.densify_from_iter and utils.check_update_at_this_iter(
-            iteration, args.bsz, args.densification_interval, 0
-        ):
+        if iteration > args.densify_from_iter and iteration in densify_iters:
             utils.check_memory_usage(
                 log_file, args, iteration, gaussians, before_densification_stop=False
             )
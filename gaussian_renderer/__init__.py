@@ -1094,19 +1094,17 @@ def gsplat_distributed_preprocess3dgs_and_all2all_final(
         tanfovy = math.tan(viewpoint_camera.FoVy * 0.5)
         focal_length_x = viewpoint_camera.image_width / (2 * tanfovx)
         focal_length_y = viewpoint_camera.image_height / (2 * tanfovy)
-        K = torch.tensor(
-            [
-                [focal_length_x, 0, viewpoint_camera.image_width / 2.0],
-                [0, focal_length_y, viewpoint_camera.image_height / 2.0],
-                [0, 0, 1],
-            ],
-            device="cuda",
-        )
+        # intrinsics are gathered on the host and copied to the gpu once for the whole batch.
+        K = [
+            [focal_length_x, 0, viewpoint_camera.image_width / 2.0],
+            [0, focal_length_y, viewpoint_camera.image_height / 2.0],
+            [0, 0, 1],
+        ]
         viewmat = viewpoint_camera.world_view_transform.transpose(0, 1)  # why transpose
         Ks.append(K)
         viewmats.append(viewmat)
 
-    batched_Ks = torch.stack(Ks)  # (B, 3, 3)
+    batched_Ks = torch.tensor(Ks, device="cuda")  # (B, 3, 3)
     batched_viewmats = torch.stack(viewmats)  # (B, 4, 4)
     image_width = int(batched_viewpoint_cameras[0].image_width)
     image_height = int(batched_viewpoint_cameras[0].image_height)
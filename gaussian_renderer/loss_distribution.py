@@ -229,7 +229,7 @@ def general_distributed_loss_computation(
     local_image_rect_gt = viewpoint_cam.original_image[
         :, min_pixel_y:max_pixel_y, min_pixel_x:max_pixel_x
     ].contiguous()
-    local_image_rect_gt = torch.clamp(local_image_rect_gt / 255.0, 0.0, 1.0)
+    local_image_rect_gt = local_image_rect_gt / 255.0
     timers.stop("prepare_gt_image")
 
     # Loss computation
@@ -935,7 +935,7 @@ def fast_distributed_loss_computation(
     local_image_rect_gt = viewpoint_cam.original_image[
         :, coverage_min_y:coverage_max_y, :
     ].contiguous()
-    local_image_rect_gt = torch.clamp(local_image_rect_gt / 255.0, 0.0, 1.0)
+    local_image_rect_gt = local_image_rect_gt / 255.0
     timers.stop("prepare_gt_image")
 
     # Loss computation
@@ -1466,7 +1466,7 @@ def fast_less_comm_distributed_loss_computation(
     local_image_rect_gt = viewpoint_cam.original_image[
         :, coverage_min_y:coverage_max_y, :
     ].contiguous()
-    local_image_rect_gt = torch.clamp(local_image_rect_gt / 255.0, 0.0, 1.0)
+    local_image_rect_gt = local_image_rect_gt / 255.0
     timers.stop("prepare_gt_image")
 
     # Loss computation
@@ -1830,7 +1830,7 @@ def fast_less_comm_noallreduceloss_distributed_loss_computation(
     local_image_rect_gt = viewpoint_cam.original_image[
         :, coverage_min_y:coverage_max_y, :
     ].contiguous()
-    local_image_rect_gt = torch.clamp(local_image_rect_gt / 255.0, 0.0, 1.0)
+    local_image_rect_gt = local_image_rect_gt / 255.0
     timers.stop("prepare_gt_image")
 
     # Loss computation
@@ -1930,7 +1930,7 @@ def functional_allreduce_distributed_loss_computation(
     local_image_rect_gt = viewpoint_cam.original_image[
         :, coverage_min_y:coverage_max_y, :
     ].contiguous()
-    local_image_rect_gt = torch.clamp(local_image_rect_gt / 255.0, 0.0, 1.0)
+    local_image_rect_gt = local_image_rect_gt / 255.0
     timers.stop("prepare_gt_image")
 
     # Loss computation
@@ -2104,7 +2104,7 @@ def avoid_pixel_all2all_loss_computation(
     local_image_rect_gt = viewpoint_cam.original_image[
         :, coverage_min_y:coverage_max_y, :
     ].contiguous()
-    local_image_rect_gt = torch.clamp(local_image_rect_gt / 255.0, 0.0, 1.0)
+    local_image_rect_gt = local_image_rect_gt / 255.0
     timers.stop("prepare_gt_image")
 
     # Loss computation
@@ -2221,7 +2221,7 @@ def avoid_pixel_all2all_loss_computation_adjust_mode6(
     local_image_rect_gt = viewpoint_cam.original_image[
         :, coverage_min_y:coverage_max_y, coverage_min_x:coverage_max_x
     ].contiguous()
-    local_image_rect_gt = torch.clamp(local_image_rect_gt / 255.0, 0.0, 1.0)
+    local_image_rect_gt = local_image_rect_gt / 255.0
     timers.stop("prepare_gt_image")
 
     # Loss computation
@@ -2266,7 +2266,7 @@ def replicated_loss_computation(
         viewpoint_cam.gt_image_comm_op is not None
     ):
         viewpoint_cam.gt_image_comm_op.wait()
-    gt_image = torch.clamp(viewpoint_cam.original_image / 255.0, 0.0, 1.0)
+    gt_image = viewpoint_cam.original_image / 255.0
     timers.stop("prepare_gt_image")
     utils.check_initial_gpu_memory_usage("after prepare_gt_image")
 
@@ -2340,7 +2340,7 @@ def load_camera_from_cpu_to_all_gpu_for_eval(
         if args.local_sampling:
             for idx, camera in enumerate(batched_cameras):
                 if camera.original_image_backup is not None:
-                    camera.original_image = camera.original_image_backup.cuda()
+                    camera.original_image = camera.to_device()
                     scatter_list = [
                         camera.original_image for _ in range(utils.IN_NODE_GROUP.size())
                     ]
@@ -2364,32 +2364,11 @@ def load_camera_from_cpu_to_all_gpu_for_eval(
                 torch.distributed.barrier(group=utils.DEFAULT_GROUP)
             return
 
-        if utils.IN_NODE_GROUP.rank() == 0:
-            for camera in batched_cameras:
-                camera.original_image = camera.original_image_backup.cuda()
-                scatter_list = [
-                    camera.original_image for _ in range(utils.IN_NODE_GROUP.size())
-                ]
-                torch.distributed.scatter(
-                    camera.original_image,
-                    scatter_list=scatter_list,
-                    src=utils.get_first_rank_on_cur_node(),
-                    group=utils.IN_NODE_GROUP,
-                )
-        else:
-            for camera in batched_cameras:
-                camera.original_image = torch.zeros(
-                    (3, utils.IMG_H, utils.IMG_W), dtype=torch.uint8, device="cuda"
-                )
-                torch.distributed.scatter(
-                    camera.original_image,
-                    scatter_list=None,
-                    src=utils.get_first_rank_on_cur_node(),
-                    group=utils.IN_NODE_GROUP,
-                )
+        for camera in batched_cameras:
+            camera.original_image = camera.get_gpu_image()
     else:
         for camera in batched_cameras:
-            camera.original_image = camera.original_image_backup.cuda()
+            camera.original_image = camera.to_device()
 
 
 def load_camera_from_cpu_to_all_gpu(batched_cameras, batched_strategies, gpuid2tasks):
@@ -2399,7 +2378,9 @@ def load_camera_from_cpu_to_all_gpu(batched_cameras, batched_strategies, gpuid2t
     # Asynchronously load ground-truth image to GPU
     timers.start("load_gt_image_to_gpu")
 
-    def load_camera_from_cpu_to_gpu(first_task, last_task):
+    def load_camera_from_cpu_to_gpu(first_task, last_task, prefetch=False):
+        # prefetch: upload on the copy stream, overlapping with rendering; only for images that are read by
+        # final_system_loss_computation() alone, which waits for them.
         coverage_min_max_y = {}
         coverage_min_y_first_task = get_coverage_y_min(first_task[1])
         coverage_max_y_last_task = get_coverage_y_max(last_task[2])
@@ -2411,11 +2392,14 @@ def load_camera_from_cpu_to_all_gpu(batched_cameras, batched_strategies, gpuid2t
             if camera_id_in_batch == last_task[0]:
                 coverage_max_y = coverage_max_y_last_task
 
-            batched_cameras[camera_id_in_batch].original_image = (
-                batched_cameras[camera_id_in_batch]
-                .original_image_backup[:, coverage_min_y:coverage_max_y, :]
-                .cuda()
-            )
+            if prefetch:
+                batched_cameras[camera_id_in_batch].prefetch_image(
+                    coverage_min_y, coverage_max_y
+                )
+            else:
+                batched_cameras[camera_id_in_batch].original_image = batched_cameras[
+                    camera_id_in_batch
+                ].to_device(coverage_min_y, coverage_max_y)
             coverage_min_max_y[camera_id_in_batch] = (coverage_min_y, coverage_max_y)
         return coverage_min_max_y
 
@@ -2424,7 +2408,7 @@ def load_camera_from_cpu_to_all_gpu(batched_cameras, batched_strategies, gpuid2t
             # TODO: may preloaded
             first_task = gpuid2tasks[utils.GLOBAL_RANK][0]
             last_task = gpuid2tasks[utils.GLOBAL_RANK][-1]
-            _ = load_camera_from_cpu_to_gpu(first_task, last_task)
+            _ = load_camera_from_cpu_to_gpu(first_task, last_task, prefetch=True)
         elif utils.IN_NODE_GROUP.rank() == 0:
             in_node_first_rank = utils.GLOBAL_RANK
             in_node_last_rank = in_node_first_rank + utils.IN_NODE_GROUP.size() - 1
@@ -2434,7 +2418,7 @@ def load_camera_from_cpu_to_all_gpu(batched_cameras, batched_strategies, gpuid2t
     else:
         first_task = gpuid2tasks[utils.GLOBAL_RANK][0]
         last_task = gpuid2tasks[utils.GLOBAL_RANK][-1]
-        _ = load_camera_from_cpu_to_gpu(first_task, last_task)
+        _ = load_camera_from_cpu_to_gpu(first_task, last_task, prefetch=True)
 
     timers.stop("load_gt_image_to_gpu")
 
@@ -2558,13 +2542,18 @@ def final_system_loss_computation(
 
     # Move partial image_gt which is needed to GPU.
     timers.start("prepare_gt_image")
-    local_image_rect_gt = torch.clamp(viewpoint_cam.original_image / 255.0, 0.0, 1.0)
+    viewpoint_cam.wait_image()
+    # original_image is uint8, so the normalized gt is already in [0, 1]: no clamp kernel needed.
+    local_image_rect_gt = viewpoint_cam.original_image / 255.0
     timers.stop("prepare_gt_image")
 
     # Loss computation
     timers.start("local_loss_computation")
-    torch.cuda.synchronize()
-    start_time = time.time()
+    # timed with cuda events instead of two device-wide synchronizes; finish_strategy_final() reads them
+    # after backward, when the loss kernels have long completed.
+    loss_start_event = torch.cuda.Event(enable_timing=True)
+    loss_end_event = torch.cuda.Event(enable_timing=True)
+    loss_start_event.record()
     pixelwise_Ll1 = pixelwise_l1_with_mask(
         local_image_rect, local_image_rect_gt, local_image_rect_pixels_compute_locally
     )
@@ -2575,8 +2564,8 @@ def final_system_loss_computation(
     )
     ssim_loss = pixelwise_ssim_loss.sum() / (utils.get_num_pixels() * 3)
 
-    torch.cuda.synchronize()
-    statistic_collector["forward_loss_time"] = (time.time() - start_time) * 1000
+    loss_end_event.record()
+    statistic_collector["forward_loss_events"] = (loss_start_event, loss_end_event)
     # utils.check_initial_gpu_memory_usage("after ssim_loss")
     timers.stop(
         "local_loss_computation"
@@ -2599,6 +2588,8 @@ def batched_loss_computation(
     timers.start("loss_computation")
     batched_losses = []
     loss_sum = 0
+    # shared by every camera that is not rendered locally; torch.stack() below copies it anyway.
+    zero_losses = torch.zeros(2, device="cuda")
     for idx, (
         image,
         camera,
@@ -2616,10 +2607,10 @@ def batched_loss_computation(
     ):
         if image is None:  # This image is not rendered locally.
             loss = 0
-            batched_losses.append([0.0, 0.0])
+            batched_losses.append(zero_losses)
         elif len(image.shape) == 0:  # This image is not rendered locally.
             loss = image * 0
-            batched_losses.append([loss, 0.0])
+            batched_losses.append(zero_losses)
         else:
             Ll1, ssim_loss = final_system_loss_computation(
                 image, camera, compute_locally, strategy, statistic_collector
@@ -2629,9 +2620,11 @@ def batched_loss_computation(
             )
             # print(f"ssim_loss: {1-ssim_loss}")
 
-            batched_losses.append([Ll1, ssim_loss])
+            batched_losses.append(torch.stack([Ll1.detach(), ssim_loss.detach()]))
         loss_sum += loss
 
     assert loss_sum.dim() == 0, "The loss_sum must be a scalar tensor."
+    # (bsz, 2) tensor of [Ll1, ssim_loss]; it stays on gpu, so that it can be reduced without a sync per element.
+    batched_losses = torch.stack(batched_losses)
     timers.stop("loss_computation")
     return loss_sum * args.lr_scale_loss, batched_losses
@@ -119,13 +119,10 @@ def render_set(model_path, name, iteration, views, gaussians, pipeline, backgrou
                     gt_camera.original_image.shape, device="cuda", dtype=torch.float32
                 )
 
-            if utils.DEFAULT_GROUP.size() > 1:
-                torch.distributed.all_reduce(
-                    image, op=dist.ReduceOp.SUM, group=utils.DEFAULT_GROUP
-                )
+            utils.all_reduce_hierarchical(image)
 
             image = torch.clamp(image, 0.0, 1.0)
-            gt_image = torch.clamp(gt_camera.original_image / 255.0, 0.0, 1.0)
+            gt_image = gt_camera.original_image / 255.0
 
             if utils.GLOBAL_RANK == 0:
                 torchvision.utils.save_image(
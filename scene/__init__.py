@@ -12,6 +12,7 @@
 import os
 import random
 import json
+from collections import deque
 from random import randint
 from utils.system_utils import searchForMaxIteration
 from scene.dataset_readers import sceneLoadTypeCallbacks
@@ -240,15 +241,17 @@ class SceneDataset:
             else:
                 self.cur_epoch_cameras = list(range(self.camera_size))
             # random.shuffle(self.cur_epoch_cameras)
-            indices = torch.randperm(len(self.cur_epoch_cameras))
-            self.cur_epoch_cameras = [self.cur_epoch_cameras[i] for i in indices]
+            indices = torch.randperm(len(self.cur_epoch_cameras)).tolist()
+            # a deque, so that taking the next camera from the front is O(1) instead of O(#cameras).
+            self.cur_epoch_cameras = deque(self.cur_epoch_cameras[i] for i in indices)
 
         self.cur_iteration += 1
 
         idx = 0
         while self.cameras[self.cur_epoch_cameras[idx]].uid in batched_cameras_uid:
             idx += 1
-        camera_idx = self.cur_epoch_cameras.pop(idx)
+        camera_idx = self.cur_epoch_cameras[idx]
+        del self.cur_epoch_cameras[idx]
         viewpoint_cam = self.cameras[camera_idx]
         return camera_idx, viewpoint_cam
 
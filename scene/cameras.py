@@ -10,15 +10,50 @@
 #
 
 import torch
-from torch import nn
 import numpy as np
-from utils.graphics_utils import getWorld2View2, getProjectionMatrix
+from utils.graphics_utils import (
+    getWorld2View2,
+    getWorld2View2_batch,
+    getProjectionMatrix,
+    getCameraCenter,
+)
 from utils.general_utils import get_args, get_log_file
 import utils.general_utils as utils
-import time
+from functools import cached_property, lru_cache
 
 
-class Camera(nn.Module):
+@lru_cache(maxsize=64)
+def _projection_matrix(fovx, fovy, znear, zfar):
+    return (
+        getProjectionMatrix(znear=znear, zfar=zfar, fovX=fovx, fovY=fovy)
+        .transpose(0, 1)
+        .contiguous()
+    )
+
+
+_COPY_STREAM = None
+
+
+def get_copy_stream():
+    # Side stream for the H2D uploads of camera data, so that they overlap with kernels on the compute stream.
+    # Created lazily: it must live on the device selected by safe_state().
+    global _COPY_STREAM
+    if _COPY_STREAM is None:
+        _COPY_STREAM = torch.cuda.Stream()
+    # a camera built before safe_state() would have created the stream on gpu 0: fail instead of copying there.
+    assert (
+        _COPY_STREAM.device.index == torch.cuda.current_device()
+    ), f"copy stream is on {_COPY_STREAM.device}, but the current device is cuda:{torch.cuda.current_device()}"
+    return _COPY_STREAM
+
+
+def cached_projection_matrix(fovx, fovy, znear, zfar):
+    # Cameras of a dataset mostly share their intrinsics, so the (transposed) cpu projection matrix is
+    # computed once per set of intrinsics. The returned tensor is shared: never modify it in place.
+    return _projection_matrix(round(fovx, 9), round(fovy, 9), znear, zfar)
+
+
+class Camera:
     def __init__(
         self,
         colmap_id,
@@ -32,9 +67,9 @@ class Camera(nn.Module):
         uid,
         trans=np.array([0.0, 0.0, 0.0]),
         scale=1.0,
+        transforms=None,
+        args=None,
     ):
-        super(Camera, self).__init__()
-
         self.uid = uid
         self.colmap_id = colmap_id
         self.R = R
@@ -43,11 +78,21 @@ class Camera(nn.Module):
         self.FoVy = FoVy
         self.image_name = image_name
 
-        args = get_args()
-        log_file = get_log_file()
+        # uploads issued on the copy stream that consumers have not waited for yet.
+        self._ready_evt = None
+        self._uploaded = ()
+        # pending upload of original_image started by prefetch_image().
+        self._image_ready_evt = None
+
+        # the dataset loader passes its args in, so that we do not look them up once per camera.
+        if args is None:
+            args = get_args()
 
         if args.time_image_loading:
-            start_time = time.time()
+            # cuda events only wait on the current stream, unlike a device-wide synchronize.
+            start_event = torch.cuda.Event(enable_timing=True)
+            end_event = torch.cuda.Event(enable_timing=True)
+            start_event.record()
 
         if (
             (
@@ -62,18 +107,41 @@ class Camera(nn.Module):
             )
             or (not args.distributed_dataset_storage)
         ):
-            # load to cpu
-            self.original_image_backup = image.contiguous()
+            # load to cpu. Keep the logical (C, H, W) shape but store the pixels in channels-last
+            # order, so that a band of rows [:, y0:y1, :] is one contiguous chunk of memory.
+            # Images from PILtoTorch are already channels-last, so the common path is a single copy.
+            image = image.unsqueeze(0)
             if args.preload_dataset_to_gpu:
-                self.original_image_backup = self.original_image_backup.to("cuda")
-            self.image_width = self.original_image_backup.shape[2]
-            self.image_height = self.original_image_backup.shape[1]
+                # resident on gpu: use the standard (C, H, W) layout instead, converted once here,
+                # so that to_device() can hand out views without copying.
+                copy_stream = get_copy_stream()
+                with torch.cuda.stream(copy_stream):
+                    image = image.to("cuda", non_blocking=True).contiguous()
+                self._uploaded += (image,)
+                self._ready_evt = copy_stream.record_event()
+            elif image.is_contiguous(memory_format=torch.channels_last):
+                # page-locked memory so that to_device() can issue an asynchronous DMA copy.
+                image = image.pin_memory()
+            else:
+                # e.g. the rgb slice of an rgba image: change layout while copying into pinned memory.
+                n, c, h, w = image.shape
+                pinned = torch.empty(
+                    (n, h, w, c), dtype=image.dtype, pin_memory=True
+                ).permute(0, 3, 1, 2)
+                image = pinned.copy_(image)
+            self.original_image_backup = image.squeeze(0)
+            _, self.image_height, self.image_width = self.original_image_backup.shape
         else:
             self.original_image_backup = None
             self.image_height, self.image_width = utils.get_img_size()
 
         if args.time_image_loading:
-            log_file.write(f"Image processing in {time.time() - start_time} seconds\n")
+            self.wait_ready()
+            end_event.record()
+            end_event.synchronize()
+            get_log_file().write(
+                f"Image processing in {start_event.elapsed_time(end_event)} ms\n"
+            )
 
         self.zfar = 100.0
         self.znear = 0.01
@@ -81,23 +149,206 @@ class Camera(nn.Module):
         self.trans = trans
         self.scale = scale
 
-        self.world_view_transform = (
-            torch.tensor(getWorld2View2(R, T, trans, scale)).transpose(0, 1).cuda()
+        if transforms is not None:
+            # (mats, camera_center) precomputed by Camera.build_batch(); otherwise uploaded on first access.
+            self._transforms = transforms
+        self._graph_inputs_captured = False
+
+    @cached_property
+    def _transforms(self):
+        return self.upload_transforms()
+
+    @cached_property
+    def world_view_transform_backup(self):
+        return self.world_view_transform.clone().detach()
+
+    def _ready_transforms(self):
+        transforms = self._transforms
+        if self._ready_evt is not None:
+            self.wait_ready()
+        return transforms
+
+    def wait_ready(self):
+        # Make the current stream wait for this camera's uploads on the copy stream. This happens implicitly
+        # on first use of the transforms and in to_device(); call it explicitly before reading
+        # original_image_backup on another stream.
+        if self._ready_evt is None:
+            return
+        stream = torch.cuda.current_stream()
+        stream.wait_event(self._ready_evt)
+        # the uploaded tensors were allocated on the copy stream but are now used on this one.
+        for tensor in self._uploaded:
+            tensor.record_stream(stream)
+        self._ready_evt = None
+        self._uploaded = ()
+
+    # world_view_transform, projection_matrix and full_proj_transform are views into a single (3, 4, 4) gpu tensor.
+    # Treat them as read-only: set_pose() may replace the tensor they point into.
+    @property
+    def world_view_transform(self):
+        return self._ready_transforms()[0][0]
+
+    @property
+    def projection_matrix(self):
+        return self._ready_transforms()[0][1]
+
+    @property
+    def full_proj_transform(self):
+        return self._ready_transforms()[0][2]
+
+    @property
+    def camera_center(self):
+        return self._ready_transforms()[1]
+
+    def upload_transforms(self):
+        # Returns (mats, camera_center): mats stacks world_view_transform, projection_matrix and
+        # full_proj_transform. Everything is staged in one pinned buffer and lands in one gpu allocation
+        # with a single H2D copy.
+        packed = torch.zeros(51, dtype=torch.float32, pin_memory=True)
+        packed[:16].view(4, 4).copy_(
+            torch.from_numpy(getWorld2View2(self.R, self.T, self.trans, self.scale)).t()
         )
-        self.world_view_transform_backup = self.world_view_transform.clone().detach()
-        self.projection_matrix = (
-            getProjectionMatrix(
-                znear=self.znear, zfar=self.zfar, fovX=self.FoVx, fovY=self.FoVy
-            )
-            .transpose(0, 1)
-            .cuda()
+        packed[16:32].view(4, 4).copy_(
+            cached_projection_matrix(self.FoVx, self.FoVy, self.znear, self.zfar)
+        )
+        packed[48:] = torch.from_numpy(
+            getCameraCenter(self.R, self.T, self.trans, self.scale)
         )
-        self.full_proj_transform = (
-            self.world_view_transform.unsqueeze(0).bmm(
-                self.projection_matrix.unsqueeze(0)
+        copy_stream = get_copy_stream()
+        with torch.cuda.stream(copy_stream):
+            packed = packed.to("cuda", non_blocking=True)
+            mats = packed[:48].view(3, 4, 4)
+            torch.matmul(mats[0], mats[1], out=mats[2])
+        self._uploaded += (packed,)
+        self._ready_evt = copy_stream.record_event()
+        return mats, packed[48:]
+
+    @classmethod
+    def build_batch(
+        cls,
+        R_list,
+        T_list,
+        FoVx_list,
+        FoVy_list,
+        trans=np.array([0.0, 0.0, 0.0]),
+        scale=1.0,
+        znear=0.01,
+        zfar=100.0,
+    ):
+        # Build the transforms of all cameras at once: vectorized numpy, a single H2D copy and one bmm,
+        # instead of several tiny copies and kernel launches per camera.
+        # Returns (mats, camera_center) with shapes (N, 3, 4, 4) and (N, 3);
+        # pass (mats[i], camera_center[i]) to Camera(transforms=...).
+        n = len(R_list)
+        Rs = np.stack(R_list)
+        Ts = np.stack(T_list)
+        # world_view_transform (stored transposed) and camera_center of every camera are computed on the host
+        # in float64 like getWorld2View2() and sent to the gpu as float32, together with the projection matrices.
+        packed = torch.zeros((n, 51), dtype=torch.float32).pin_memory()
+        packed[:, :16] = torch.from_numpy(
+            getWorld2View2_batch(Rs, Ts, trans, scale).transpose(0, 2, 1).reshape(n, 16)
+        )
+        packed[:, 16:32] = torch.stack(
+            [
+                cached_projection_matrix(fovx, fovy, znear, zfar).view(16)
+                for fovx, fovy in zip(FoVx_list, FoVy_list)
+            ]
+        )
+        packed[:, 48:] = torch.from_numpy(
+            np.float32((-np.einsum("nij,nj->ni", Rs, Ts) + trans) * scale)
+        )
+        packed = packed.to("cuda", non_blocking=True)
+        mats = packed[:, :48].view(n, 3, 4, 4)
+        mats[:, 2] = torch.bmm(mats[:, 0], mats[:, 1])
+        return mats, packed[:, 48:]
+
+    def to_device(self, coverage_min_y=0, coverage_max_y=None, stream=None):
+        # Copy rows [coverage_min_y, coverage_max_y) of the ground-truth image to gpu without blocking the host.
+        # The band is contiguous in the channels-last backup, so this is a single DMA copy; the result is
+        # converted back to a standard contiguous (C, H, W) tensor on gpu, as collectives and loss kernels expect.
+        # If `stream` is given, the copy is issued on it and consumers on other streams
+        # must synchronize with `stream` before the first use of the returned tensor.
+        # A backup preloaded to gpu is already (C, H, W): the rows are returned as a view, without any copy.
+        self.wait_ready()
+        image = self.original_image_backup[:, coverage_min_y:coverage_max_y, :]
+        if image.is_cuda:
+            return image
+        if stream is None:
+            return image.to("cuda", non_blocking=True).contiguous()
+        with torch.cuda.stream(stream):
+            return image.to("cuda", non_blocking=True).contiguous()
+
+    def prefetch_image(self, coverage_min_y=0, coverage_max_y=None):
+        # Start uploading rows [coverage_min_y, coverage_max_y) of the ground-truth image into original_image
+        # on the copy stream and return at once, so the copy overlaps with rendering.
+        # Call wait_image() on the consuming stream before reading original_image.
+        copy_stream = get_copy_stream()
+        self.original_image = self.to_device(
+            coverage_min_y, coverage_max_y, stream=copy_stream
+        )
+        self._image_ready_evt = copy_stream.record_event()
+
+    def wait_image(self):
+        if self._image_ready_evt is None:
+            return
+        stream = torch.cuda.current_stream()
+        stream.wait_event(self._image_ready_evt)
+        self.original_image.record_stream(stream)
+        self._image_ready_evt = None
+
+    def get_gpu_image(self, stream=None):
+        # Full ground-truth image on this gpu. With distributed_dataset_storage, only the first rank of each node
+        # keeps the pinned cpu copy: it uploads it and broadcasts it to the other ranks of its node,
+        # so every rank of the node must call this for the same cameras in the same order.
+        args = get_args()
+        if not args.distributed_dataset_storage:
+            return self.to_device(stream=stream)
+
+        if utils.IN_NODE_GROUP.rank() == 0:
+            image = self.to_device(stream=stream)
+            if stream is not None:
+                torch.cuda.current_stream().wait_stream(stream)
+        else:
+            image = torch.empty(
+                (3, self.image_height, self.image_width),
+                dtype=torch.uint8,
+                device="cuda",
             )
-        ).squeeze(0)
-        self.camera_center = self.world_view_transform.inverse()[3, :3]
+        torch.distributed.broadcast(
+            image,
+            src=utils.get_first_rank_on_cur_node(),
+            group=utils.IN_NODE_GROUP,
+        )
+        return image
+
+    def capture_graph_inputs(self):
+        # Move the transforms to gpu buffers owned by this camera, whose addresses never change afterwards:
+        # a render captured in a CUDA graph that reads them stays valid across set_pose() calls.
+        # Returns the buffers by name.
+        if not self._graph_inputs_captured:
+            # clone: the transforms may be views into batched or shared storage.
+            self._transforms = tuple(t.clone() for t in self._ready_transforms())
+            self._graph_inputs_captured = True
+        mats, camera_center = self._transforms
+        return {
+            "world_view_transform": mats[0],
+            "projection_matrix": mats[1],
+            "full_proj_transform": mats[2],
+            "camera_center": camera_center,
+        }
+
+    def set_pose(self, R, T):
+        # materialize the backup first: get_camera2world() is relative to the original pose.
+        self.world_view_transform_backup
+        self.R = R
+        self.T = T
+        transforms = self.upload_transforms()
+        if self._graph_inputs_captured:
+            self.wait_ready()
+            for static, new in zip(self._transforms, transforms):
+                static.copy_(new)
+        else:
+            self._transforms = transforms
 
     def get_camera2world(self):
         return self.world_view_transform_backup.t().inverse()
@@ -111,27 +362,9 @@ class Camera(nn.Module):
             c2w[2, 3] += dz
 
             t_prime = c2w[:3, 3]
-            self.T = (-c2w[:3, :3].t() @ t_prime).cpu().numpy()
             # import pdb; pdb.set_trace()
 
-            self.world_view_transform = (
-                torch.tensor(getWorld2View2(self.R, self.T, self.trans, self.scale))
-                .transpose(0, 1)
-                .cuda()
-            )
-            self.projection_matrix = (
-                getProjectionMatrix(
-                    znear=self.znear, zfar=self.zfar, fovX=self.FoVx, fovY=self.FoVy
-                )
-                .transpose(0, 1)
-                .cuda()
-            )
-            self.full_proj_transform = (
-                self.world_view_transform.unsqueeze(0).bmm(
-                    self.projection_matrix.unsqueeze(0)
-                )
-            ).squeeze(0)
-            self.camera_center = self.world_view_transform.inverse()[3, :3]
+            self.set_pose(self.R, (-c2w[:3, :3].t() @ t_prime).cpu().numpy())
 
 
 class MiniCam:
@@ -154,5 +387,8 @@ class MiniCam:
         self.zfar = zfar
         self.world_view_transform = world_view_transform
         self.full_proj_transform = full_proj_transform
-        view_inv = torch.inverse(self.world_view_transform)
-        self.camera_center = view_inv[3][:3]
+
+    @cached_property
+    def camera_center(self):
+        # world_view_transform is [[R, 0], [t, 1]] with R orthonormal, so the camera center is -R @ t.
+        return -(self.world_view_transform[:3, :3] @ self.world_view_transform[3, :3])
@@ -22,6 +22,7 @@ from utils.graphics_utils import BasicPointCloud
 from utils.general_utils import strip_symmetric, build_scaling_rotation
 import utils.general_utils as utils
 import torch.distributed as dist
+from torch._utils import _flatten_dense_tensors, _unflatten_dense_tensors
 
 lr_scale_fns = {
     "linear": lambda x: x,
@@ -63,6 +64,8 @@ class GaussianModel:
         )  # TODO: deal with self.send_to_gpui_cnt
         self.denom = torch.empty(0)
         self.optimizer = None
+        # list returned by all_parameters(); reset wherever the parameter tensors are replaced.
+        self._all_parameters_cache = None
         self.percent_dense = 0
         self.spatial_lr_scale = 0
         self.setup_functions()
@@ -232,16 +235,20 @@ class GaussianModel:
         )
 
     def all_parameters(self):
-        return [
-            self._xyz,
-            self._features_dc,
-            self._features_rest,
-            self._scaling,
-            self._rotation,
-            self._opacity,
-        ]
+        if self._all_parameters_cache is None:
+            self._all_parameters_cache = [
+                self._xyz,
+                self._features_dc,
+                self._features_rest,
+                self._scaling,
+                self._rotation,
+                self._opacity,
+            ]
+        return self._all_parameters_cache
 
     def training_setup(self, training_args):
+        # parameters are created or loaded before this point.
+        self._all_parameters_cache = None
         self.percent_dense = training_args.percent_dense
         self.xyz_gradient_accum = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
         self.denom = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
@@ -336,29 +343,40 @@ class GaussianModel:
         # log the statistics of the gaussian model
         # number of total 3dgs on this rank
         num_3dgs = self._xyz.shape[0]
-        # average size of 3dgs
-        avg_size = torch.mean(torch.max(self.get_scaling, dim=1).values).item()
-        # average opacity
-        avg_opacity = torch.mean(self.get_opacity).item()
-        stats = {
-            "num_3dgs": num_3dgs,
-            "avg_size": avg_size,
-            "avg_opacity": avg_opacity,
-        }
+        # the scalars below are copied to the host together: one sync instead of one per .item().
+        scalars = [
+            # average size of 3dgs
+            torch.mean(torch.max(self.get_scaling, dim=1).values),
+            # average opacity
+            torch.mean(self.get_opacity),
+        ]
 
         # get the exp_avg, exp_avg_sq state for all parameters
-        exp_avg_dict = {}
-        exp_avg_sq_dict = {}
+        group_names = []
         for group in self.optimizer.param_groups:
             stored_state = self.optimizer.state.get(group["params"][0], None)
             if stored_state is not None:
                 if "exp_avg" in stored_state:
-                    exp_avg_dict[group["name"]] = torch.mean(
-                        torch.norm(stored_state["exp_avg"], dim=-1)
-                    ).item()
-                    exp_avg_sq_dict[group["name"]] = torch.mean(
-                        torch.norm(stored_state["exp_avg_sq"], dim=-1)
-                    ).item()
+                    group_names.append(group["name"])
+                    scalars.append(
+                        torch.mean(
+                            torch.linalg.vector_norm(stored_state["exp_avg"], dim=-1)
+                        )
+                    )
+                    scalars.append(
+                        torch.mean(
+                            torch.linalg.vector_norm(stored_state["exp_avg_sq"], dim=-1)
+                        )
+                    )
+        scalars = torch.stack(scalars).cpu().tolist()
+
+        stats = {
+            "num_3dgs": num_3dgs,
+            "avg_size": scalars[0],
+            "avg_opacity": scalars[1],
+        }
+        exp_avg_dict = dict(zip(group_names, scalars[2::2]))
+        exp_avg_sq_dict = dict(zip(group_names, scalars[3::2]))
         return stats, exp_avg_dict, exp_avg_sq_dict
 
     def sync_gradients_for_replicated_3dgs_storage(self, batched_screenspace_pkg):
@@ -559,6 +577,7 @@ class GaussianModel:
         )
         optimizable_tensors = self.replace_tensor_to_optimizer(opacities_new, "opacity")
         self._opacity = optimizable_tensors["opacity"]
+        self._all_parameters_cache = None
 
     def prune_based_on_opacity(self, min_opacity):
         prune_mask = (self.get_opacity < min_opacity).squeeze()
@@ -823,6 +842,7 @@ class GaussianModel:
         self._opacity = optimizable_tensors["opacity"]
         self._scaling = optimizable_tensors["scaling"]
         self._rotation = optimizable_tensors["rotation"]
+        self._all_parameters_cache = None
 
         self.xyz_gradient_accum = self.xyz_gradient_accum[valid_points_mask]
 
@@ -907,6 +927,7 @@ class GaussianModel:
         self._opacity = optimizable_tensors["opacity"]
         self._scaling = optimizable_tensors["scaling"]
         self._rotation = optimizable_tensors["rotation"]
+        self._all_parameters_cache = None
 
         self.xyz_gradient_accum = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
         self.denom = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
@@ -973,7 +994,7 @@ class GaussianModel:
     def densify_and_clone(self, grads, grad_threshold, scene_extent):
         # Extract points that satisfy the gradient condition
         selected_pts_mask = torch.where(
-            torch.norm(grads, dim=-1) >= grad_threshold, True, False
+            torch.linalg.vector_norm(grads, dim=-1) >= grad_threshold, True, False
         )
         selected_pts_mask = torch.logical_and(
             selected_pts_mask,
@@ -1005,22 +1026,25 @@ class GaussianModel:
     def densify_and_prune(self, max_grad, min_opacity, extent, max_screen_size):
         args = utils.get_args()
         if not args.gaussians_distribution and utils.DEFAULT_GROUP.size() > 1:
-            torch.distributed.all_reduce(
-                self.max_radii2D, op=dist.ReduceOp.MAX, group=utils.DP_GROUP
+            # max and sum cannot share one reduction; issue both before waiting on either.
+            max_radii2D_work = torch.distributed.all_reduce(
+                self.max_radii2D,
+                op=dist.ReduceOp.MAX,
+                group=utils.DP_GROUP,
+                async_op=True,
             )
-            torch.distributed.all_reduce(
-                self.xyz_gradient_accum, op=dist.ReduceOp.SUM, group=utils.DP_GROUP
-            )
-            torch.distributed.all_reduce(
-                self.denom, op=dist.ReduceOp.SUM, group=utils.DP_GROUP
+            # both stats are (N, 1) and summed: reduce them in a single call.
+            stats = torch.cat([self.xyz_gradient_accum, self.denom], dim=1)
+            stats_work = torch.distributed.all_reduce(
+                stats, op=dist.ReduceOp.SUM, group=utils.DP_GROUP, async_op=True
             )
+            max_radii2D_work.wait()
+            stats_work.wait()
+            self.xyz_gradient_accum, self.denom = stats[:, 0:1], stats[:, 1:2]
 
         grads = self.xyz_gradient_accum / self.denom
-        grads[grads.isnan()] = 0.0
-
-        densification_stats = {}
-        densification_stats["view_space_grad"] = grads.mean().item()
-        densification_stats["view_space_grad_max"] = grads.max().item()
+        # masked_fill_ instead of boolean indexing: no nonzero() and no device-to-host sync.
+        grads.masked_fill_(grads.isnan(), 0.0)
 
         self.densify_and_clone(grads, max_grad, extent)
         self.densify_and_split(grads, max_grad, extent)
@@ -1041,12 +1065,10 @@ class GaussianModel:
             )
         self.prune_points(prune_mask)
 
-        torch.cuda.empty_cache()
-
     def add_densification_stats(
         self, viewspace_point_tensor, update_filter
     ):  # the :2] is a weird implementation. It is because viewspace_point_tensor is (N, 3) tensor.
-        self.xyz_gradient_accum[update_filter] += torch.norm(
+        self.xyz_gradient_accum[update_filter] += torch.linalg.vector_norm(
             viewspace_point_tensor.grad[update_filter, :2], dim=-1, keepdim=True
         )
         self.denom[update_filter] += 1
@@ -1058,11 +1080,55 @@ class GaussianModel:
         # Normalize the gradients to [-1, 1] screen size
         grad[:, 0] *= width * 0.5
         grad[:, 1] *= height * 0.5
-        self.xyz_gradient_accum[update_filter] += torch.norm(
+        self.xyz_gradient_accum[update_filter] += torch.linalg.vector_norm(
             grad[update_filter, :2], dim=-1, keepdim=True
         )
         self.denom[update_filter] += 1
 
+    def add_densification_stats_batched(
+        self, batched_viewspace_point_tensor, batched_update_filter
+    ):
+        # Same as calling add_densification_stats() for each camera of the batch, with one set of kernels for the whole batch.
+        update_filter = torch.stack(batched_update_filter)  # (bsz, N)
+        grad_norm = torch.linalg.vector_norm(
+            torch.stack([t.grad[:, :2] for t in batched_viewspace_point_tensor]), dim=-1
+        )
+        grad_norm = torch.where(update_filter, grad_norm, 0.0)
+        self.xyz_gradient_accum += grad_norm.sum(dim=0).unsqueeze(-1)
+        self.denom += update_filter.sum(dim=0).unsqueeze(-1)
+
+    def gsplat_add_densification_stats_batched(
+        self, batched_viewspace_point_tensor_grad, batched_update_filter, width, height
+    ):
+        # Same as calling gsplat_add_densification_stats() for each camera of the batch, with one set of kernels.
+        update_filter = torch.stack(batched_update_filter)  # (bsz, N)
+        grad = torch.stack(list(batched_viewspace_point_tensor_grad))  # (bsz, N, 2)
+        # Normalize the gradients to [-1, 1] screen size
+        grad[..., 0] *= width * 0.5
+        grad[..., 1] *= height * 0.5
+        grad_norm = torch.where(
+            update_filter, torch.linalg.vector_norm(grad[..., :2], dim=-1), 0.0
+        )
+        self.xyz_gradient_accum += grad_norm.sum(dim=0).unsqueeze(-1)
+        self.denom += update_filter.sum(dim=0).unsqueeze(-1)
+
+    def update_max_radii2D_batched(self, batched_radii):
+        # Same as updating max_radii2D camera by camera under the visibility filter, without building the mask.
+        # Both backends in gaussian_renderer derive the filter from exactly these radii:
+        # - diff_gaussian_rasterization: one (N,) radii tensor per camera, filter `radii > 0` for each of them.
+        # - gsplat (fully_fused_projection, packed=False): a (bsz, N) radii tensor, filter `batched_radiis > 0`.
+        # max_radii2D is never negative, so the radii of invisible gaussians (<= 0) never win the max.
+        # batched_radii: list of (N,) tensors, or a (bsz, N) tensor (gsplat).
+        if not torch.is_tensor(batched_radii):
+            batched_radii = torch.stack(batched_radii)
+        # the equivalence only holds for one scalar radius per gaussian and camera; gsplat versions that
+        # return per-axis radii (bsz, N, 2) need their own visibility reduction.
+        assert (
+            batched_radii.dim() == 2
+            and batched_radii.shape[1:] == self.max_radii2D.shape
+        ), f"expected (bsz, {self.max_radii2D.shape[0]}) radii, got {tuple(batched_radii.shape)}"
+        torch.maximum(self.max_radii2D, batched_radii.amax(dim=0), out=self.max_radii2D)
+
     def group_for_redistribution(self):
         args = utils.get_args()
         if args.gaussians_distribution:
@@ -1309,6 +1375,7 @@ class GaussianModel:
         self._opacity = optimizable_tensors["opacity"]
         self._scaling = optimizable_tensors["scaling"]
         self._rotation = optimizable_tensors["rotation"]
+        self._all_parameters_cache = None
 
         self.xyz_gradient_accum = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
         self.denom = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
@@ -1326,8 +1393,6 @@ class GaussianModel:
             device="cuda",
         )
 
-        torch.cuda.empty_cache()
-
 
 def get_sparse_ids(tensors):
     sparse_ids = None
@@ -1409,9 +1474,10 @@ def sync_gradients_densely(gaussians, group):
 
 def sync_gradients_fused_densely(gaussians, group):
     with torch.no_grad():
-        # 1. cat all parameters' grad to a single tensor
+        # 1. flatten all parameters' grad to a single buffer
         # 2. allreduce
-        # 3. split the allreduced tensor to each parameter's grad
+        # 3. copy the allreduced buffer back to each parameter's grad
+        # the grads have different ranks ((N, 3), (N, 1, 3), ...), so they are flattened rather than catted on dim 1.
         all_params_grads = [
             param.grad.data
             for param in [
@@ -1423,16 +1489,15 @@ def sync_gradients_fused_densely(gaussians, group):
                 gaussians._rotation,
             ]
         ]
-        all_params_grads_dim1 = [param_grad.shape[1] for param_grad in all_params_grads]
-        catted_params_grads = torch.cat(all_params_grads, dim=1).contiguous()
+        flat_params_grads = _flatten_dense_tensors(all_params_grads)
         torch.distributed.all_reduce(
-            catted_params_grads, op=dist.ReduceOp.SUM, group=group
+            flat_params_grads, op=dist.ReduceOp.SUM, group=group
         )
-        split_params_grads = torch.split(
-            catted_params_grads, all_params_grads_dim1, dim=1
-        )
-        for param_grad, split_param_grad in zip(all_params_grads, split_params_grads):
-            param_grad.copy_(split_param_grad)
+        for param_grad, synced_param_grad in zip(
+            all_params_grads,
+            _unflatten_dense_tensors(flat_params_grads, all_params_grads),
+        ):
+            param_grad.copy_(synced_param_grad)
 
 
 def sync_gradients_fused_sparsely(gaussians, group):
@@ -54,17 +54,17 @@ if __name__ == "__main__":
     if utils.GLOBAL_RANK == 0:
         os.makedirs(args.log_folder, exist_ok=True)
         os.makedirs(args.model_path, exist_ok=True)
-    if utils.WORLD_SIZE > 1:
-        torch.distributed.barrier(
-            group=utils.DEFAULT_GROUP
-        )  # log_folder is created before other ranks start writing log.
+    # log_folder is created before other ranks start writing log.
+    utils.wait_for_rank_0(utils.DEFAULT_GROUP)
     if utils.GLOBAL_RANK == 0:
         with open(args.log_folder + "/args.json", "w") as f:
             json.dump(vars(args), f)
 
     # Initialize system state (RNG)
     safe_state(args.quiet)
-    torch.autograd.set_detect_anomaly(args.detect_anomaly)
+    if args.detect_anomaly:
+        # anomaly mode is off by default; only touch the autograd state when it is asked for.
+        torch.autograd.set_detect_anomaly(True)
 
     # Initialize log file and print all args
     log_file = open(
@@ -75,10 +75,15 @@ if __name__ == "__main__":
         + str(utils.GLOBAL_RANK)
         + ".log",
         "a" if args.auto_start_checkpoint else "w",
+        # the training loop flushes it every log_interval iterations.
+        buffering=1024 * 1024,
     )
     utils.set_log_file(log_file)
     print_all_args(args, log_file)
 
+    if args.record_memory_history:
+        utils.start_memory_history()
+
     train_internal.training(
         lp.extract(args), op.extract(args), pp.extract(args), args, log_file
     )
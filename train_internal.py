@@ -24,9 +24,48 @@ from utils.general_utils import prepare_output_and_logger, globally_sync_for_tim
 import utils.general_utils as utils
 from utils.timer import Timer, End2endTimer
 from tqdm import tqdm
-from utils.image_utils import psnr
 import torch.distributed as dist
 from densification import densification, gsplat_densification
+from concurrent.futures import ThreadPoolExecutor
+
+
+def save_json(data, path):
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+
+def flush_pending_losses(pending_losses, train_dataset, log_file, ema_loss_for_log):
+    # pending_losses: [(iteration, batched_loss on gpu, batched_image_names)] of the iterations since the last flush.
+    # All their losses come to the host with one copy. Returns the updated ema loss.
+    if len(pending_losses) == 0:
+        return ema_loss_for_log
+    args = utils.get_args()
+    all_batched_loss_cpu = (
+        torch.stack([batched_loss for _, batched_loss, _ in pending_losses])
+        .cpu()
+        .numpy()
+    )
+    for (iteration, _, batched_image_names), batched_loss_cpu in zip(
+        pending_losses, all_batched_loss_cpu
+    ):
+        ema_loss_for_log = (
+            batched_loss_cpu.mean()
+            if ema_loss_for_log is None
+            else 0.6 * ema_loss_for_log + 0.4 * batched_loss_cpu.mean()
+        )
+        # Update Epoch Statistics
+        train_dataset.update_losses(batched_loss_cpu)
+        # Logging
+        batched_loss_cpu = [round(loss, 6) for loss in batched_loss_cpu]
+        log_string = "iteration[{},{}) loss: {} image: {}\n".format(
+            iteration,
+            iteration + args.bsz,
+            batched_loss_cpu,
+            batched_image_names,
+        )
+        log_file.write(log_string)
+    pending_losses.clear()
+    return ema_loss_for_log
 
 
 def training(dataset_args, opt_args, pipe_args, args, log_file):
@@ -59,6 +98,13 @@ def training(dataset_args, opt_args, pipe_args, args, log_file):
         scene.log_scene_info_to_file(log_file, "Scene Info Before Training")
     utils.check_initial_gpu_memory_usage("after init and before training loop")
 
+    # densify_and_prune and redistribute_gaussians keep reallocating tensors whose length changes,
+    # which fragments the caching allocator. Expandable segments let it grow segments in place instead.
+    # Enabled only now, so that the tensors created during init keep regular segments.
+    # Opt-in: the option only exists since pytorch 2.1, older allocators reject it.
+    if args.expandable_segments and "PYTORCH_CUDA_ALLOC_CONF" not in os.environ:
+        torch.cuda.memory._set_allocator_settings("expandable_segments:True")
+
     # Init dataset
     train_dataset = SceneDataset(scene.getTrainCameras())
     if args.adjust_strategy_warmp_iterations == -1:
@@ -87,17 +133,37 @@ def training(dataset_args, opt_args, pipe_args, args, log_file):
         range(1, opt_args.iterations + 1),
         desc="Training progress",
         disable=(utils.LOCAL_RANK != 0),
+        mininterval=1.0,  # redraw at most once per second; update() is cheap in between.
     )
     progress_bar.update(start_from_this_iteration - 1)
     num_trained_batches = 0
 
+    if args.local_sampling:
+        assert (
+            args.bsz % utils.WORLD_SIZE == 0
+        ), "Batch size should be divisible by the number of GPUs."
+        # output of the all_gather of sampled camera ids; reused by every iteration.
+        batched_all_cameras_idx_buffer = torch.empty(
+            (utils.WORLD_SIZE, args.bsz // utils.WORLD_SIZE), device="cuda", dtype=int
+        )
+
+    # serializes and writes the strategy history in the background, so that save points do not stall training.
+    json_save_pool = ThreadPoolExecutor(max_workers=1)
+
+    # iterations at which the periodic events fire; fixed for the run, so computed once.
+    sh_degree_iters = utils.get_update_iters(
+        start_from_this_iteration, opt_args.iterations, args.bsz, 1000, 0
+    )
+    log_flush_iters = utils.get_update_iters(
+        start_from_this_iteration, opt_args.iterations, args.bsz, args.log_interval, 0
+    )
+
     ema_loss_for_log = 0
+    pending_losses = []
     for iteration in range(
         start_from_this_iteration, opt_args.iterations + 1, args.bsz
     ):
         # Step Initialization
-        if iteration // args.bsz % 30 == 0:
-            progress_bar.set_postfix({"Loss": f"{ema_loss_for_log:.{7}f}"})
         progress_bar.update(args.bsz)
         utils.set_cur_iter(iteration)
         gaussians.update_learning_rate(iteration)
@@ -106,27 +172,25 @@ def training(dataset_args, opt_args, pipe_args, args, log_file):
         if args.nsys_profile:
             nvtx.range_push(f"iteration[{iteration},{iteration+args.bsz})")
         # Every 1000 its we increase the levels of SH up to a maximum degree
-        if utils.check_update_at_this_iter(iteration, args.bsz, 1000, 0):
+        if iteration in sh_degree_iters:
             gaussians.oneupSHdegree()
 
         # Prepare data: Pick random Cameras for training
         if args.local_sampling:
-            assert (
-                args.bsz % utils.WORLD_SIZE == 0
-            ), "Batch size should be divisible by the number of GPUs."
             batched_cameras_idx = train_dataset.get_batched_cameras_idx(
                 args.bsz // utils.WORLD_SIZE
             )
-            batched_all_cameras_idx = torch.zeros(
-                (utils.WORLD_SIZE, len(batched_cameras_idx)), device="cuda", dtype=int
-            )
             batched_cameras_idx = torch.tensor(
                 batched_cameras_idx, device="cuda", dtype=int
             )
             torch.distributed.all_gather_into_tensor(
-                batched_all_cameras_idx, batched_cameras_idx, group=utils.DEFAULT_GROUP
+                batched_all_cameras_idx_buffer,
+                batched_cameras_idx,
+                group=utils.DEFAULT_GROUP,
+            )
+            batched_all_cameras_idx = (
+                batched_all_cameras_idx_buffer.cpu().numpy().squeeze()
             )
-            batched_all_cameras_idx = batched_all_cameras_idx.cpu().numpy().squeeze()
             batched_cameras = train_dataset.get_batched_cameras_from_idx(
                 batched_all_cameras_idx
             )
@@ -162,10 +226,6 @@ def training(dataset_args, opt_args, pipe_args, args, log_file):
             batched_image, batched_compute_locally = gsplat_render_final(
                 batched_screenspace_pkg, batched_strategies
             )
-            batch_statistic_collector = [
-                cuda_args["stats_collector"]
-                for cuda_args in batched_screenspace_pkg["batched_cuda_args"]
-            ]
         else:
             batched_screenspace_pkg = distributed_preprocess3dgs_and_all2all_final(
                 batched_cameras,
@@ -178,10 +238,11 @@ def training(dataset_args, opt_args, pipe_args, args, log_file):
             batched_image, batched_compute_locally = render_final(
                 batched_screenspace_pkg, batched_strategies
             )
-            batch_statistic_collector = [
-                cuda_args["stats_collector"]
-                for cuda_args in batched_screenspace_pkg["batched_cuda_args"]
-            ]
+
+        batch_statistic_collector = [
+            cuda_args["stats_collector"]
+            for cuda_args in batched_screenspace_pkg["batched_cuda_args"]
+        ]
 
         loss_sum, batched_losses = batched_loss_computation(
             batched_image,
@@ -190,6 +251,9 @@ def training(dataset_args, opt_args, pipe_args, args, log_file):
             batched_strategies,
             batch_statistic_collector,
         )
+        # the gt images are no longer read after the loss; autograd keeps whatever backward needs.
+        for viewpoint_cam in batched_cameras:
+            viewpoint_cam.original_image = None
 
         timers.start("backward")
         loss_sum.backward()
@@ -210,35 +274,31 @@ def training(dataset_args, opt_args, pipe_args, args, log_file):
 
             # Sync losses in the batch
             timers.start("sync_loss_and_log")
-            batched_losses = torch.tensor(batched_losses, device="cuda")
-            if utils.DEFAULT_GROUP.size() > 1:
-                dist.all_reduce(
-                    batched_losses, op=dist.ReduceOp.SUM, group=utils.DEFAULT_GROUP
-                )
+            loss_comm_work = utils.all_reduce_hierarchical(
+                batched_losses, async_op=True
+            )
+            # host-only bookkeeping, overlapped with the all_reduce.
+            batched_image_names = [
+                viewpoint_cam.image_name for viewpoint_cam in batched_cameras
+            ]
+            if loss_comm_work is not None:
+                loss_comm_work.wait()
             batched_loss = (1.0 - args.lambda_dssim) * batched_losses[
                 :, 0
             ] + args.lambda_dssim * (1.0 - batched_losses[:, 1])
-            batched_loss_cpu = batched_loss.cpu().numpy()
-            ema_loss_for_log = (
-                batched_loss_cpu.mean()
-                if ema_loss_for_log is None
-                else 0.6 * ema_loss_for_log + 0.4 * batched_loss_cpu.mean()
-            )
-            # Update Epoch Statistics
-            train_dataset.update_losses(batched_loss_cpu)
-            # Logging
-            batched_loss_cpu = [round(loss, 6) for loss in batched_loss_cpu]
-            log_string = "iteration[{},{}) loss: {} image: {}\n".format(
-                iteration,
-                iteration + args.bsz,
-                batched_loss_cpu,
-                [viewpoint_cam.image_name for viewpoint_cam in batched_cameras],
-            )
-            log_file.write(log_string)
+            # the losses stay on gpu and are logged in bulk every log_interval iterations: no host sync here.
+            pending_losses.append((iteration, batched_loss, batched_image_names))
+            if iteration in log_flush_iters:
+                ema_loss_for_log = flush_pending_losses(
+                    pending_losses, train_dataset, log_file, ema_loss_for_log
+                )
+                # the ema loss only changes here, so this is the only place the postfix needs refreshing.
+                progress_bar.set_postfix(
+                    {"Loss": f"{ema_loss_for_log:.{7}f}"}, refresh=False
+                )
             timers.stop("sync_loss_and_log")
 
             # Evaluation
-            end2end_timers.stop()
             training_report(
                 iteration,
                 l1_loss,
@@ -247,8 +307,8 @@ def training(dataset_args, opt_args, pipe_args, args, log_file):
                 pipe_args,
                 background,
                 args.backend,
+                end2end_timers,
             )
-            end2end_timers.start()
 
             # Densification
             if args.backend == "gsplat":
@@ -269,19 +329,21 @@ def training(dataset_args, opt_args, pipe_args, args, log_file):
                 end2end_timers.print_time(log_file, iteration + args.bsz)
                 utils.print_rank_0("\n[ITER {}] Saving Gaussians".format(iteration))
                 log_file.write("[ITER {}] Saving Gaussians\n".format(iteration))
+                log_file.flush()
                 scene.save(iteration)
 
                 if args.save_strategy_history:
-                    with open(
+                    # snapshot the history: the training loop keeps appending to it.
+                    json_save_pool.submit(
+                        save_json,
+                        list(strategy_history.to_json()),
                         args.log_folder
                         + "/strategy_history_ws="
                         + str(utils.WORLD_SIZE)
                         + "_rk="
                         + str(utils.GLOBAL_RANK)
                         + ".json",
-                        "w",
-                    ) as f:
-                        json.dump(strategy_history.to_json(), f)
+                    )
                 end2end_timers.start()
 
             # Save Checkpoints
@@ -297,10 +359,7 @@ def training(dataset_args, opt_args, pipe_args, args, log_file):
                 save_folder = scene.model_path + "/checkpoints/" + str(iteration) + "/"
                 if utils.DEFAULT_GROUP.rank() == 0:
                     os.makedirs(save_folder, exist_ok=True)
-                    if utils.DEFAULT_GROUP.size() > 1:
-                        torch.distributed.barrier(group=utils.DEFAULT_GROUP)
-                elif utils.DEFAULT_GROUP.size() > 1:
-                    torch.distributed.barrier(group=utils.DEFAULT_GROUP)
+                utils.wait_for_rank_0(utils.DEFAULT_GROUP)
                 torch.save(
                     (gaussians.capture(), iteration + args.bsz),
                     save_folder
@@ -319,9 +378,14 @@ def training(dataset_args, opt_args, pipe_args, args, log_file):
                 if (
                     args.lr_scale_mode != "accumu"
                 ):  # we scale the learning rate rather than accumulate the gradients.
-                    for param in gaussians.all_parameters():
-                        if param.grad is not None:
-                            param.grad /= args.bsz
+                    grads = [
+                        param.grad
+                        for param in gaussians.all_parameters()
+                        if param.grad is not None
+                    ]
+                    if len(grads) > 0:
+                        # one multi-tensor kernel for all gradients.
+                        torch._foreach_div_(grads, args.bsz)
 
                 if not args.stop_update_param:
                     gaussians.optimizer.step()
@@ -330,18 +394,18 @@ def training(dataset_args, opt_args, pipe_args, args, log_file):
                 utils.check_initial_gpu_memory_usage("after optimizer step")
 
         # Finish a iteration and clean up
-        torch.cuda.synchronize()
-        for (
-            viewpoint_cam
-        ) in batched_cameras:  # Release memory of locally rendered original_image
-            viewpoint_cam.original_image = None
+        # No device-wide synchronize here: the allocator is stream-ordered, and the gt images were
+        # already released after the loss computation.
         if args.nsys_profile:
             nvtx.range_pop()
         if utils.check_enable_python_timer():
             timers.printTimers(iteration, mode="sum")
-        log_file.flush()
+        # the log file is opened with a large buffer; push it to disk every log_interval iterations only.
+        if iteration in log_flush_iters:
+            log_file.flush()
 
     # Finish training
+    flush_pending_losses(pending_losses, train_dataset, log_file, ema_loss_for_log)
     if opt_args.iterations not in args.save_iterations:
         end2end_timers.print_time(log_file, opt_args.iterations)
     log_file.write(
@@ -350,10 +414,19 @@ def training(dataset_args, opt_args, pipe_args, args, log_file):
         )
     )
     progress_bar.close()
+    json_save_pool.shutdown(wait=True)
+    log_file.flush()
 
 
 def training_report(
-    iteration, l1_loss, testing_iterations, scene: Scene, pipe_args, background, backend
+    iteration,
+    l1_loss,
+    testing_iterations,
+    scene: Scene,
+    pipe_args,
+    background,
+    backend,
+    end2end_timers=None,
 ):
     args = utils.get_args()
     log_file = utils.get_log_file()
@@ -365,16 +438,24 @@ def training_report(
     ):
         testing_iterations.pop(0)
         utils.print_rank_0("\n[ITER {}] Start Testing".format(iteration))
+        # pause the end2end timer only when we actually evaluate: stop() and start() synchronize the device.
+        if end2end_timers is not None:
+            end2end_timers.stop()
 
+        test_cameras = scene.getTestCameras()
+        train_cameras = scene.getTrainCameras()
         validation_configs = (
-            {"name": "test", "cameras": scene.getTestCameras(), "num_cameras": len(scene.getTestCameras())},
+            {"name": "test", "cameras": test_cameras, "num_cameras": len(test_cameras)},
             {
                 "name": "train",
-                "cameras": scene.getTrainCameras(),
-                "num_cameras": max(len(scene.getTrainCameras()) // args.llffhold, args.bsz),
+                "cameras": train_cameras,
+                "num_cameras": max(len(train_cameras) // args.llffhold, args.bsz),
             },
         )
 
+        # evaluation buffers, allocated on first use and shared by all batches of the same image size.
+        image_buffer = None
+        gt_image_buffer = None
         # init workload division strategy
         for config in validation_configs:
             if config["cameras"] and len(config["cameras"]) > 0:
@@ -451,34 +532,55 @@ def training_report(
                         batched_image, _ = render_final(
                             batched_screenspace_pkg, batched_strategies
                         )
+                    # all images of the scene have the same size: gather the batch in buffers reused across
+                    # batches and reduce it with a single all_reduce instead of one per camera.
+                    image_shape = (len(batched_cameras),) + tuple(
+                        batched_cameras[0].original_image.shape
+                    )
+                    if image_buffer is None or image_buffer.shape != image_shape:
+                        image_buffer = torch.empty(
+                            image_shape, device="cuda", dtype=torch.float32
+                        )
+                        gt_image_buffer = torch.empty(
+                            image_shape, device="cuda", dtype=torch.uint8
+                        )
                     for camera_id, (image, gt_camera) in enumerate(
                         zip(batched_image, batched_cameras)
                     ):
                         if (
                             image is None or len(image.shape) == 0
                         ):  # The image is not rendered locally.
-                            image = torch.zeros(
-                                gt_camera.original_image.shape,
-                                device="cuda",
-                                dtype=torch.float32,
-                            )
-
-                        if utils.DEFAULT_GROUP.size() > 1:
-                            torch.distributed.all_reduce(
-                                image, op=dist.ReduceOp.SUM, group=utils.DEFAULT_GROUP
-                            )
-
-                        image = torch.clamp(image, 0.0, 1.0)
-                        gt_image = torch.clamp(
-                            gt_camera.original_image / 255.0, 0.0, 1.0
-                        )
-
-                        if idx + camera_id < num_cameras + 1:
-                            l1_test += l1_loss(image, gt_image).mean().double()
-                            psnr_test += psnr(image, gt_image).mean().double()
+                            image_buffer[camera_id].zero_()
+                        else:
+                            image_buffer[camera_id].copy_(image)
+                        gt_image_buffer[camera_id].copy_(gt_camera.original_image)
                         gt_camera.original_image = None
-                psnr_test /= num_cameras
-                l1_test /= num_cameras
+                    batched_image = image_buffer
+                    batched_gt_image = gt_image_buffer
+                    utils.all_reduce_hierarchical(batched_image)
+
+                    # only the first num_cameras cameras are evaluated.
+                    n_valid = min(len(batched_cameras), num_cameras + 1 - idx)
+                    batched_image = batched_image[:n_valid].clamp_(0.0, 1.0)
+                    # one difference tensor for both metrics. The uint8 gt is normalized inside the
+                    # subtraction (it already lands in [0, 1], so it needs no clamp).
+                    diff = torch.sub(
+                        batched_image, batched_gt_image[:n_valid], alpha=1.0 / 255.0
+                    )
+                    l1_test += diff.abs().mean(dim=(1, 2, 3)).double().sum()
+                    # psnr per channel as in utils.image_utils.psnr(), averaged over the channels of each image.
+                    mse = diff.square().flatten(2).mean(dim=2)
+                    psnr_test += (
+                        (20 * torch.log10(1.0 / torch.sqrt(mse)))
+                        .mean(dim=1)
+                        .double()
+                        .sum()
+                    )
+                # one device-to-host copy for both metrics; the log lines then hold plain floats,
+                # which is what analyze.py parses.
+                l1_test, psnr_test = (
+                    torch.stack([l1_test, psnr_test]) / num_cameras
+                ).tolist()
                 utils.print_rank_0(
                     "\n[ITER {}] Evaluating {}: L1 {} PSNR {}".format(
                         iteration, config["name"], l1_test, psnr_test
@@ -490,4 +592,8 @@ def training_report(
                     )
                 )
 
-        torch.cuda.empty_cache()
+        # returning the cached blocks to the driver syncs the device and makes training re-grow the cache.
+        if args.empty_cache_after_test:
+            torch.cuda.empty_cache()
+        if end2end_timers is not None:
+            end2end_timers.start()
@@ -22,11 +22,10 @@ import torch
 from PIL import Image
 
 
-def loadCam(args, id, cam_info, decompressed_image=None, return_image=False):
+def loadCam(
+    args, id, cam_info, decompressed_image=None, return_image=False, transforms=None
+):
     orig_w, orig_h = cam_info.width, cam_info.height
-    assert (
-        orig_w == utils.get_img_width() and orig_h == utils.get_img_height()
-    ), "All images should have the same size. "
 
     args = get_args()
     log_file = get_log_file()
@@ -57,7 +56,8 @@ def loadCam(args, id, cam_info, decompressed_image=None, return_image=False):
             log_file.write(f"PILtoTorch image in {time.time() - start_time} seconds\n")
 
         # assert resized_image_rgb.shape[0] == 3, "Image should have exactly 3 channels!"
-        gt_image = resized_image_rgb[:3, ...].contiguous()
+        # no .contiguous() here: PILtoTorch returns a channels-last view, which Camera stores as is.
+        gt_image = resized_image_rgb[:3, ...]
         loaded_mask = None
 
         # Free the memory: because the PIL image has been converted to torch tensor, we don't need it anymore. And it takes up lots of cpu memory.
@@ -80,6 +80,8 @@ def loadCam(args, id, cam_info, decompressed_image=None, return_image=False):
         gt_alpha_mask=loaded_mask,
         image_name=cam_info.image_name,
         uid=id,
+        transforms=transforms,
+        args=args,
     )
 
 
@@ -210,6 +212,12 @@ def decompressed_images_from_camInfos_multiprocess_sharedmem(
 def cameraList_from_camInfos(cam_infos, args):
     args = get_args()
 
+    # checked once here rather than in every loadCam().
+    img_w, img_h = utils.get_img_width(), utils.get_img_height()
+    assert all(
+        c.width == img_w and c.height == img_h for c in cam_infos
+    ), "All images should have the same size. "
+
     if args.multiprocesses_image_loading:
         decompressed_images = decompressed_images_from_camInfos_multiprocess(
             cam_infos, args
@@ -218,6 +226,14 @@ def cameraList_from_camInfos(cam_infos, args):
     else:
         decompressed_images = [None for _ in cam_infos]
 
+    if len(cam_infos) > 0:
+        batched_transforms = Camera.build_batch(
+            [c.R for c in cam_infos],
+            [c.T for c in cam_infos],
+            [c.FovX for c in cam_infos],
+            [c.FovY for c in cam_infos],
+        )
+
     camera_list = []
     for id, c in tqdm(
         enumerate(cam_infos), total=len(cam_infos), disable=(utils.LOCAL_RANK != 0)
@@ -229,6 +245,7 @@ def cameraList_from_camInfos(cam_infos, args):
                 c,
                 decompressed_image=decompressed_images[id],
                 return_image=False,
+                transforms=(batched_transforms[0][id], batched_transforms[1][id]),
             )
         )
 
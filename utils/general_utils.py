@@ -18,8 +18,11 @@ import random
 import os
 import torch.distributed as dist
 import time
+import math
 from argparse import Namespace
 import psutil
+from functools import lru_cache
+import pickle
 
 ARGS = None
 LOG_FILE = None
@@ -31,6 +34,7 @@ DP_GROUP = None
 MP_GROUP = None
 DEFAULT_GROUP = None
 IN_NODE_GROUP = None
+NODE_LEADER_GROUP = None  # first rank of every node; only set with more than one node.
 TIMERS = None
 DENSIFY_ITER = 0
 
@@ -120,6 +124,8 @@ def get_denfify_iter():
 
 def inc_densify_iter():
     global DENSIFY_ITER
+    if get_args().record_memory_history:
+        dump_memory_snapshot()
     DENSIFY_ITER += 1
 
 
@@ -144,18 +150,19 @@ def globally_sync_for_timer():
 
 
 def check_update_at_this_iter(iteration, bsz, update_interval, update_residual):
-    residual_l = iteration % update_interval
-    residual_r = residual_l + bsz
-    # residual_l <= update_residual < residual_r
-    if residual_l <= update_residual and update_residual < residual_r:
-        return True
-    # residual_l <= update_residual+update_interval < residual_r
-    if (
-        residual_l <= update_residual + update_interval
-        and update_residual + update_interval < residual_r
-    ):
-        return True
-    return False
+    # true iff some iteration in [iteration, iteration + bsz) is congruent to update_residual modulo update_interval.
+    return (update_residual - iteration) % update_interval < bsz
+
+
+@lru_cache(maxsize=None)
+def get_update_iters(first_iter, last_iter, bsz, update_interval, update_residual):
+    # iterations of range(first_iter, last_iter + 1, bsz) at which check_update_at_this_iter() is true.
+    # the schedule is fixed for a run, so it is computed once and tested with a set lookup.
+    return frozenset(
+        iteration
+        for iteration in range(first_iter, last_iter + 1, bsz)
+        if check_update_at_this_iter(iteration, bsz, update_interval, update_residual)
+    )
 
 
 class SingleGPUGroup:
@@ -170,29 +177,29 @@ class SingleGPUGroup:
 
 
 def check_comm_group():
-    tensor = torch.ones(1, device="cuda")
-    if WORLD_SIZE > 1:
-        torch.distributed.all_reduce(tensor, group=DEFAULT_GROUP)
-        print(
-            f"DEFAULT_GROUP.rank() {DEFAULT_GROUP.rank()} tensor: {tensor.item()}\n",
-            flush=True,
-        )
-    tensor = torch.ones(1, device="cuda")
-    if DP_GROUP.size() > 1:
-        torch.distributed.all_reduce(tensor, group=DP_GROUP)
-        print(
-            f"DP_GROUP.rank() {DP_GROUP.rank()} tensor: {tensor.item()}\n", flush=True
-        )
-    tensor = torch.ones(1, device="cuda")
-    if MP_GROUP.size() > 1:
-        torch.distributed.all_reduce(tensor, group=MP_GROUP)
-        print(
-            f"MP_GROUP.rank() {MP_GROUP.rank()} tensor: {tensor.item()}\n", flush=True
-        )
+    groups = [
+        (name, group)
+        for name, group in [
+            ("DEFAULT_GROUP", DEFAULT_GROUP),
+            ("DP_GROUP", DP_GROUP),
+            ("MP_GROUP", MP_GROUP),
+        ]
+        if group is not None and group.size() > 1
+    ]
+    # one buffer for all groups: issue every all_reduce first, then wait and read them back with a single sync.
+    tensor = torch.ones(len(groups), device="cuda")
+    works = [
+        torch.distributed.all_reduce(tensor[i : i + 1], group=group, async_op=True)
+        for i, (_, group) in enumerate(groups)
+    ]
+    for work in works:
+        work.wait()
+    for (name, group), value in zip(groups, tensor.tolist()):
+        print(f"{name}.rank() {group.rank()} tensor: {value}\n", flush=True)
 
 
 def init_distributed(args):
-    global GLOBAL_RANK, LOCAL_RANK, WORLD_SIZE, DEFAULT_GROUP, IN_NODE_GROUP
+    global GLOBAL_RANK, LOCAL_RANK, WORLD_SIZE, DEFAULT_GROUP, IN_NODE_GROUP, NODE_LEADER_GROUP
     GLOBAL_RANK = int(os.environ.get("RANK", 0))
     LOCAL_RANK = int(os.environ.get("LOCAL_RANK", 0))
     WORLD_SIZE = int(os.environ.get("WORLD_SIZE", 1))
@@ -209,14 +216,13 @@ def init_distributed(args):
 
         num_gpu_per_node = one_node_device_count()
         n_of_nodes = WORLD_SIZE // num_gpu_per_node
-        all_in_node_group = []
-        for rank in range(n_of_nodes):
-            in_node_group_ranks = list(
-                range(rank * num_gpu_per_node, (rank + 1) * num_gpu_per_node)
+        # one group per block of num_gpu_per_node consecutive ranks; returns the one this rank belongs to.
+        IN_NODE_GROUP, _ = dist.new_subgroups(group_size=num_gpu_per_node)
+        if n_of_nodes > 1:
+            # every rank must take part in new_group(), even the ones outside the group.
+            NODE_LEADER_GROUP = dist.new_group(
+                list(range(0, n_of_nodes * num_gpu_per_node, num_gpu_per_node))
             )
-            all_in_node_group.append(dist.new_group(in_node_group_ranks))
-        node_rank = GLOBAL_RANK // num_gpu_per_node
-        IN_NODE_GROUP = all_in_node_group[node_rank]
         print(
             "Initializing -> "
             + " world_size: "
@@ -234,18 +240,78 @@ def init_distributed(args):
         IN_NODE_GROUP = SingleGPUGroup()
 
 
+@lru_cache(maxsize=None)
+def cuda_device_count():
+    # the number of visible gpus does not change during a run; avoid querying the driver on every call.
+    return torch.cuda.device_count()
+
+
 def one_node_device_count():
     global WORLD_SIZE
-    return min(torch.cuda.device_count(), WORLD_SIZE)
+    return min(cuda_device_count(), WORLD_SIZE)
 
 
 def get_first_rank_on_cur_node():
     global GLOBAL_RANK
-    NODE_ID = GLOBAL_RANK // one_node_device_count()
-    first_rank_in_node = NODE_ID * one_node_device_count()
+    num_gpu_per_node = one_node_device_count()
+    NODE_ID = GLOBAL_RANK // num_gpu_per_node
+    first_rank_in_node = NODE_ID * num_gpu_per_node
     return first_rank_in_node
 
 
+def all_reduce_hierarchical(tensor, op=dist.ReduceOp.SUM, async_op=False):
+    # All_reduce `tensor` over DEFAULT_GROUP in place. Across several nodes, reduce inside each node first, all_reduce
+    # among the node leaders only and broadcast the result back inside each node: the slow inter-node links
+    # carry one copy per node instead of one per gpu.
+    # With async_op=True, returns the work handle of the last stage (None if there is nothing to reduce). The earlier
+    # stages run on other communicators, so they are issued synchronously: that only orders them on the current
+    # stream, the host does not wait for them.
+    if NODE_LEADER_GROUP is None:
+        if DEFAULT_GROUP.size() > 1:
+            return torch.distributed.all_reduce(
+                tensor, op=op, group=DEFAULT_GROUP, async_op=async_op
+            )
+        return None
+    first_rank_on_node = get_first_rank_on_cur_node()
+    torch.distributed.reduce(tensor, dst=first_rank_on_node, op=op, group=IN_NODE_GROUP)
+    if GLOBAL_RANK == first_rank_on_node:
+        torch.distributed.all_reduce(tensor, op=op, group=NODE_LEADER_GROUP)
+    return torch.distributed.broadcast(
+        tensor, src=first_rank_on_node, group=IN_NODE_GROUP, async_op=async_op
+    )
+
+
+def all_gather_into_tensor_hierarchical(output, input, in_node_output):
+    # all_gather_into_tensor over DEFAULT_GROUP, staged like all_reduce_hierarchical(): gather inside each node,
+    # gather the per-node blocks among the node leaders only, then broadcast the full result inside each node.
+    # ranks are numbered node by node, so the blocks land in global rank order.
+    # in_node_output: caller-owned staging tensor of shape (IN_NODE_GROUP.size(),) + input.shape.
+    if NODE_LEADER_GROUP is None:
+        torch.distributed.all_gather_into_tensor(output, input, group=DEFAULT_GROUP)
+        return
+    first_rank_on_node = get_first_rank_on_cur_node()
+    torch.distributed.all_gather_into_tensor(in_node_output, input, group=IN_NODE_GROUP)
+    if GLOBAL_RANK == first_rank_on_node:
+        torch.distributed.all_gather_into_tensor(
+            output, in_node_output, group=NODE_LEADER_GROUP
+        )
+    torch.distributed.broadcast(output, src=first_rank_on_node, group=IN_NODE_GROUP)
+
+
+def wait_for_rank_0(group):
+    # Make the other ranks of `group` wait until global rank 0 reaches this call, e.g. after it created a folder.
+    # Unlike a barrier, rank 0 itself does not wait for the others.
+    if group.size() == 1:
+        return
+    ready = torch.ones(1, dtype=torch.uint8, device=torch.device("cuda", LOCAL_RANK))
+    torch.distributed.broadcast(ready, src=0, group=group)
+    if GLOBAL_RANK != 0:
+        ready.item()  # the broadcast is asynchronous: block the host until it has arrived.
+
+
+_ALLGATHER_BUFFERS = {}
+
+
 def our_allgather_among_cpu_processes_float_list(data, group):
     ## official implementation: torch.distributed.all_gather_object()
     # all_data = [None for _ in range(group.size())]
@@ -256,16 +322,39 @@ def our_allgather_among_cpu_processes_float_list(data, group):
     assert isinstance(data, list) and isinstance(
         data[0], float
     ), "data should be a list of float"
-    data_gpu = torch.tensor(data, dtype=torch.float32, device="cuda")
-    all_data_gpu = torch.empty(
-        (group.size(), len(data_gpu)), dtype=torch.float32, device="cuda"
+    if group.size() == 1:
+        return [list(data)]
+
+    # the buffers are reused across calls: the shapes only change with the batch size.
+    key = (group.size(), len(data))
+    if key not in _ALLGATHER_BUFFERS:
+        _ALLGATHER_BUFFERS[key] = (
+            torch.empty(len(data), dtype=torch.float32, pin_memory=True),
+            torch.empty(len(data), dtype=torch.float32, device="cuda"),
+            torch.empty(key, dtype=torch.float32, device="cuda"),
+            torch.empty(key, dtype=torch.float32, pin_memory=True),
+            # staging for the in-node stage of all_gather_into_tensor_hierarchical().
+            torch.empty(
+                (IN_NODE_GROUP.size(), len(data)), dtype=torch.float32, device="cuda"
+            ),
+        )
+    data_cpu, data_gpu, all_data_gpu, all_data_cpu, in_node_data_gpu = (
+        _ALLGATHER_BUFFERS[key]
     )
-    if group.size() > 1:
-        torch.distributed.all_gather_into_tensor(all_data_gpu, data_gpu, group=group)
+    # stage the list in pinned memory so the upload is a real async copy, queued behind the pending gpu work.
+    # reusing data_cpu is safe: the previous call synchronized after its copies.
+    data_cpu.copy_(torch.tensor(data, dtype=torch.float32))
+    data_gpu.copy_(data_cpu, non_blocking=True)
+    if group is DEFAULT_GROUP:
+        all_gather_into_tensor_hierarchical(all_data_gpu, data_gpu, in_node_data_gpu)
     else:
-        all_data_gpu = data_gpu.unsqueeze(0)
+        torch.distributed.all_gather_into_tensor(all_data_gpu, data_gpu, group=group)
+    all_data_cpu.copy_(all_data_gpu, non_blocking=True)
+    torch.cuda.current_stream().synchronize()
 
-    all_data = all_data_gpu.cpu().tolist()
+    # callers keep the result (e.g. in the json strategy history), so return plain floats
+    # rather than a view of the reused pinned buffer.
+    all_data = all_data_cpu.numpy().tolist()
     return all_data
 
 
@@ -277,7 +366,27 @@ def get_local_chunk_l_r(array_length, world_size, rank):
 
 
 def inverse_sigmoid(x):
-    return torch.log(x / (1 - x))
+    # log(x / (1 - x)) in one kernel.
+    return torch.special.logit(x)
+
+
+def start_memory_history():
+    # let the cuda caching allocator record every alloc/free with its python stack, for dump_memory_snapshot().
+    # the bool form of _record_memory_history() is the one pytorch 2.0 understands.
+    torch.cuda.memory._record_memory_history(
+        True, trace_alloc_max_entries=100000, trace_alloc_record_context=True
+    )
+
+
+def dump_memory_snapshot():
+    # the pickle can be inspected offline with pytorch.org/memory_viz.
+    args = get_args()
+    path = os.path.join(
+        args.log_folder,
+        "memory_snapshot_rk={}_densify={}.pickle".format(GLOBAL_RANK, DENSIFY_ITER),
+    )
+    with open(path, "wb") as f:
+        pickle.dump(torch.cuda.memory._snapshot(), f)
 
 
 def check_initial_gpu_memory_usage(prefix):
@@ -303,10 +412,18 @@ def check_initial_gpu_memory_usage(prefix):
 def check_memory_usage(log_file, args, iteration, gaussians, before_densification_stop):
     global DEFAULT_GROUP
 
-    memory_usage = torch.cuda.memory_allocated() / 1024 / 1024 / 1024
-    max_memory_usage = torch.cuda.max_memory_allocated() / 1024 / 1024 / 1024
-    max_reserved_memory = torch.cuda.max_memory_reserved() / 1024 / 1024 / 1024
-    now_reserved_memory = torch.cuda.memory_reserved() / 1024 / 1024 / 1024
+    if not before_densification_stop and not args.check_gpu_memory:
+        # after densification stops, the numbers are only logged.
+        return
+
+    # one query of the allocator statistics instead of one call per number.
+    memory_stats = torch.cuda.memory_stats()
+    memory_usage = memory_stats["allocated_bytes.all.current"] / 1024 / 1024 / 1024
+    max_memory_usage = memory_stats["allocated_bytes.all.peak"] / 1024 / 1024 / 1024
+    max_reserved_memory = memory_stats["reserved_bytes.all.peak"] / 1024 / 1024 / 1024
+    now_reserved_memory = (
+        memory_stats["reserved_bytes.all.current"] / 1024 / 1024 / 1024
+    )
     log_str = ""
     log_str += "iteration[{},{}) {}Now num of 3dgs: {}. Now Memory usage: {} GB. Max Memory usage: {} GB. Max Reserved Memory: {} GB. Now Reserved Memory: {} GB. \n".format(
         iteration,
@@ -325,15 +442,19 @@ def check_memory_usage(log_file, args, iteration, gaussians, before_densificatio
         log_file.write(log_str)
 
     if before_densification_stop:
-        memory_usage_list = our_allgather_among_cpu_processes_float_list(
-            [max_reserved_memory], DEFAULT_GROUP
+        # only the max over all ranks is needed: one all_reduce instead of an all_gather and a python max.
+        max_reserved_memory_all_ranks = torch.tensor(
+            [max_reserved_memory], dtype=torch.float32, device="cuda"
+        )
+        all_reduce_hierarchical(
+            max_reserved_memory_all_ranks, op=torch.distributed.ReduceOp.MAX
         )
         # print("total memory: ", torch.cuda.get_device_properties(0).total_memory)
         total_memory = (
             torch.cuda.get_device_properties(0).total_memory / 1024 / 1024 / 1024
         )
         if (
-            max([a[0] for a in memory_usage_list])
+            max_reserved_memory_all_ranks.item()
             > args.densify_memory_limit_percentage * total_memory
         ):  # If memory usage is reaching the upper bound of GPU memory, stop densification to avoid OOM by fragmentation and etc.
             print(
@@ -379,33 +500,43 @@ def get_expon_lr_func(
     :return HoF which takes step as input
     """
 
+    if lr_init == 0.0 and lr_final == 0.0:
+        # Disable this parameter
+        return lambda step: 0.0
+
+    # the closed form on python scalars: no table to build, and no numpy ufunc dispatch per step.
+    # np.log, not math.log: a zero rate at one end gives -inf instead of raising, as before.
+    log_lr_init = float(np.log(lr_init))
+    log_lr_final = float(np.log(lr_final))
+
     def helper(step):
-        if step < 0 or (lr_init == 0.0 and lr_final == 0.0):
-            # Disable this parameter
+        if step < 0:
             return 0.0
         if lr_delay_steps > 0:
             # A kind of reverse cosine decay.
-            delay_rate = lr_delay_mult + (1 - lr_delay_mult) * np.sin(
-                0.5 * np.pi * np.clip(step / lr_delay_steps, 0, 1)
+            delay_rate = lr_delay_mult + (1 - lr_delay_mult) * math.sin(
+                0.5 * math.pi * min(max(step / lr_delay_steps, 0), 1)
             )
         else:
             delay_rate = 1.0
-        t = np.clip(step / max_steps, 0, 1)
-        log_lerp = np.exp(np.log(lr_init) * (1 - t) + np.log(lr_final) * t)
+        t = min(max(step / max_steps, 0), 1)
+        log_lerp = math.exp(log_lr_init * (1 - t) + log_lr_final * t)
         return delay_rate * log_lerp
 
     return helper
 
 
+# flat indices of the upper triangle of a 3x3 matrix, one tensor per device.
+_LOWERDIAG_INDICES = {}
+
+
 def strip_lowerdiag(L):
-    uncertainty = torch.zeros((L.shape[0], 6), dtype=torch.float, device="cuda")
-
-    uncertainty[:, 0] = L[:, 0, 0]
-    uncertainty[:, 1] = L[:, 0, 1]
-    uncertainty[:, 2] = L[:, 0, 2]
-    uncertainty[:, 3] = L[:, 1, 1]
-    uncertainty[:, 4] = L[:, 1, 2]
-    uncertainty[:, 5] = L[:, 2, 2]
+    indices = _LOWERDIAG_INDICES.get(L.device)
+    if indices is None:
+        indices = torch.tensor([0, 1, 2, 4, 5, 8], device=L.device)
+        _LOWERDIAG_INDICES[L.device] = indices
+    # one gather instead of a zero-filled output and six column copies.
+    uncertainty = L.reshape(L.shape[0], 9).index_select(1, indices)
     return uncertainty
 
 
@@ -414,40 +545,42 @@ def strip_symmetric(sym):
 
 
 def build_rotation(r):
-    norm = torch.sqrt(
-        r[:, 0] * r[:, 0] + r[:, 1] * r[:, 1] + r[:, 2] * r[:, 2] + r[:, 3] * r[:, 3]
-    )
-
-    q = r / norm[:, None]
-
-    R = torch.zeros((q.size(0), 3, 3), device="cuda")
+    # one reduction for the squared norm and a multiply by its rsqrt, instead of four column products, a sqrt and a divide.
+    q = r * torch.rsqrt(torch.sum(r * r, dim=1, keepdim=True))
 
     r = q[:, 0]
     x = q[:, 1]
     y = q[:, 2]
     z = q[:, 3]
 
-    R[:, 0, 0] = 1 - 2 * (y * y + z * z)
-    R[:, 0, 1] = 2 * (x * y - r * z)
-    R[:, 0, 2] = 2 * (x * z + r * y)
-    R[:, 1, 0] = 2 * (x * y + r * z)
-    R[:, 1, 1] = 1 - 2 * (x * x + z * z)
-    R[:, 1, 2] = 2 * (y * z - r * x)
-    R[:, 2, 0] = 2 * (x * z - r * y)
-    R[:, 2, 1] = 2 * (y * z + r * x)
-    R[:, 2, 2] = 1 - 2 * (x * x + y * y)
+    # each product appears in two entries of R: compute it once.
+    xx, yy, zz = x * x, y * y, z * z
+    xy, xz, yz = x * y, x * z, y * z
+    rx, ry, rz = r * x, r * y, r * z
+
+    # build R from its nine entries in one stack instead of zero-filling it and writing column by column.
+    R = torch.stack(
+        [
+            1 - 2 * (yy + zz),
+            2 * (xy - rz),
+            2 * (xz + ry),
+            2 * (xy + rz),
+            1 - 2 * (xx + zz),
+            2 * (yz - rx),
+            2 * (xz - ry),
+            2 * (yz + rx),
+            1 - 2 * (xx + yy),
+        ],
+        dim=-1,
+    ).view(-1, 3, 3)
     return R
 
 
 def build_scaling_rotation(s, r):
-    L = torch.zeros((s.shape[0], 3, 3), dtype=torch.float, device="cuda")
     R = build_rotation(r)
 
-    L[:, 0, 0] = s[:, 0]
-    L[:, 1, 1] = s[:, 1]
-    L[:, 2, 2] = s[:, 2]
-
-    L = R @ L
+    # R @ diag(s) only scales the columns of R, no batched matmul needed.
+    L = R * s.unsqueeze(1)
     return L
 
 
@@ -457,18 +590,23 @@ def safe_state(silent):
     class F:
         def __init__(self, silent):
             self.silent = silent
+            # the timestamp only has second resolution, so format it at most once per second.
+            self.last_timestamp_sec = None
+            self.last_timestamp = ""
+
+        def timestamp(self):
+            now_sec = int(time.time())
+            if now_sec != self.last_timestamp_sec:
+                self.last_timestamp_sec = now_sec
+                self.last_timestamp = datetime.fromtimestamp(now_sec).strftime(
+                    "%d/%m %H:%M:%S"
+                )
+            return self.last_timestamp
 
         def write(self, x):
             if not self.silent:
                 if x.endswith("\n"):
-                    old_f.write(
-                        x.replace(
-                            "\n",
-                            " [{}]\n".format(
-                                str(datetime.now().strftime("%d/%m %H:%M:%S"))
-                            ),
-                        )
-                    )
+                    old_f.write(x.replace("\n", " [{}]\n".format(self.timestamp())))
                 else:
                     old_f.write(x)
 
@@ -479,7 +617,7 @@ def safe_state(silent):
 
     random.seed(0)
     np.random.seed(0)
-    torch.manual_seed(0)
+    torch.manual_seed(0)  # also seeds the cuda generators of every device.
     global LOCAL_RANK
     torch.cuda.set_device(torch.device("cuda", LOCAL_RANK))
 
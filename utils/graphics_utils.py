@@ -53,6 +53,27 @@ def getWorld2View2(R, t, translate=np.array([0.0, 0.0, 0.0]), scale=1.0):
     return np.float32(Rt)
 
 
+def getWorld2View2_batch(Rs, ts, translate=np.array([0.0, 0.0, 0.0]), scale=1.0):
+    # Same as getWorld2View2() for a stack of poses: Rs is (N, 3, 3), ts is (N, 3). Returns (N, 4, 4).
+    Rs_T = Rs.transpose(0, 2, 1)
+    cam_center = -np.einsum("nij,nj->ni", Rs, ts)
+    cam_center = (cam_center + translate) * scale
+
+    Rt = np.zeros((Rs.shape[0], 4, 4))
+    Rt[:, :3, :3] = Rs_T
+    Rt[:, :3, 3] = -np.einsum("nij,nj->ni", Rs_T, cam_center)
+    Rt[:, 3, 3] = 1.0
+    return np.float32(Rt)
+
+
+def getCameraCenter(R, t, translate=np.array([0.0, 0.0, 0.0]), scale=1.0):
+    # Camera position in world space; equals np.linalg.inv(getWorld2View2(...))[:3, 3]
+    # because the rotation block of the world-to-view matrix is orthonormal.
+    cam_center = -R @ t
+    cam_center = (cam_center + translate) * scale
+    return np.float32(cam_center)
+
+
 def getProjectionMatrix(znear, zfar, fovX, fovY):
     tanHalfFovY = math.tan((fovY / 2))
     tanHalfFovX = math.tan((fovX / 2))
@@ -13,6 +13,7 @@ import torch
 import torch.nn.functional as F
 from torch.autograd import Variable
 from math import exp
+from functools import lru_cache
 
 
 def l1_loss(network_output, gt):
@@ -42,35 +43,36 @@ def create_window(window_size, channel):
     return window
 
 
-def ssim(img1, img2, window_size=11, size_average=True):
+@lru_cache(maxsize=None)
+def _cached_window(window_size, channel, device, dtype):
+    # built on the host; cached so that it is not copied to the gpu on every loss evaluation.
+    return create_window(window_size, channel).to(device=device, dtype=dtype)
+
+
+def _filtered_moments(img1, img2, window_size):
+    # mu1, mu2 and the raw second moments E[x^2], E[y^2], E[xy] for SSIM: a single grouped conv2d
+    # over the five stacked inputs instead of five separate convolutions.
     channel = img1.size(-3)
-    window = create_window(window_size, channel)
+    window = _cached_window(window_size, 5 * channel, img1.device, img1.dtype)
+    stacked = torch.cat([img1, img2, img1 * img1, img2 * img2, img1 * img2], dim=-3)
+    filtered = F.conv2d(stacked, window, padding=window_size // 2, groups=5 * channel)
+    return filtered.split(channel, dim=-3)
 
-    if img1.is_cuda:
-        window = window.cuda(img1.get_device())
-    window = window.type_as(img1)
 
-    return _ssim(img1, img2, window, window_size, channel, size_average)
+def ssim(img1, img2, window_size=11, size_average=True):
+    return _ssim(img1, img2, window_size, size_average)
 
 
-def _ssim(img1, img2, window, window_size, channel, size_average=True):
-    mu1 = F.conv2d(img1, window, padding=window_size // 2, groups=channel)
-    mu2 = F.conv2d(img2, window, padding=window_size // 2, groups=channel)
+def _ssim(img1, img2, window_size, size_average=True):
+    mu1, mu2, img1_sq, img2_sq, img1_img2 = _filtered_moments(img1, img2, window_size)
 
     mu1_sq = mu1.pow(2)
     mu2_sq = mu2.pow(2)
     mu1_mu2 = mu1 * mu2
 
-    sigma1_sq = (
-        F.conv2d(img1 * img1, window, padding=window_size // 2, groups=channel) - mu1_sq
-    )
-    sigma2_sq = (
-        F.conv2d(img2 * img2, window, padding=window_size // 2, groups=channel) - mu2_sq
-    )
-    sigma12 = (
-        F.conv2d(img1 * img2, window, padding=window_size // 2, groups=channel)
-        - mu1_mu2
-    )
+    sigma1_sq = img1_sq - mu1_sq
+    sigma2_sq = img2_sq - mu2_sq
+    sigma12 = img1_img2 - mu1_mu2
 
     C1 = 0.01**2
     C2 = 0.03**2
@@ -97,29 +99,15 @@ def pixelwise_l1_with_mask(img1, img2, pixel_mask):
 def pixelwise_ssim_with_mask(img1, img2, pixel_mask):
     window_size = 11
 
-    channel = img1.size(-3)
-    window = create_window(window_size, channel)
-    if img1.is_cuda:
-        window = window.cuda(img1.get_device())
-    window = window.type_as(img1)
-
-    mu1 = F.conv2d(img1, window, padding=window_size // 2, groups=channel)
-    mu2 = F.conv2d(img2, window, padding=window_size // 2, groups=channel)
+    mu1, mu2, img1_sq, img2_sq, img1_img2 = _filtered_moments(img1, img2, window_size)
 
     mu1_sq = mu1.pow(2)
     mu2_sq = mu2.pow(2)
     mu1_mu2 = mu1 * mu2
 
-    sigma1_sq = (
-        F.conv2d(img1 * img1, window, padding=window_size // 2, groups=channel) - mu1_sq
-    )
-    sigma2_sq = (
-        F.conv2d(img2 * img2, window, padding=window_size // 2, groups=channel) - mu2_sq
-    )
-    sigma12 = (
-        F.conv2d(img1 * img2, window, padding=window_size // 2, groups=channel)
-        - mu1_mu2
-    )
+    sigma1_sq = img1_sq - mu1_sq
+    sigma2_sq = img2_sq - mu2_sq
+    sigma12 = img1_img2 - mu1_mu2
 
     C1 = 0.01**2
     C2 = 0.03**2